@@ -0,0 +1,81 @@
+"""Compare the NumPy BMP encoder against Pillow's BMP writer on long stickers.
+
+Both encoders get the same rendered text and their output is checked to
+be byte-identical. Usage:
+
+    python benchmarks/bench_bmp.py --meters 1 2 5 --repeat 3
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src-pyloid"))
+
+from PIL import Image
+
+from fonts import font_cache
+from imaging import encode_bmp
+from layout import TextLayout
+from render import draw_lines, to_monochrome
+
+FONT_PATH = str(Path(__file__).resolve().parent.parent / "src-pyloid/assets/SpaceMono-Regular.ttf")
+DPI = 203
+FONT_SIZE = 12
+IMAGE_WIDTH_PX = 576
+
+WORDS = "the quick brown fox jumps over a lazy dog while printing receipts all day long".split()
+
+
+def pillow_bmp(image: Image.Image) -> bytes:
+    """The previous encoder: flip, then let Pillow write the BMP"""
+    buffer = io.BytesIO()
+    image.convert("1").transpose(Image.Transpose.FLIP_TOP_BOTTOM).save(buffer, "BMP")
+    return buffer.getvalue()
+
+
+def render(meters: float) -> Image.Image:
+    """Grayscale text render roughly the given length"""
+    loaded_font = font_cache.get(FONT_PATH, FONT_SIZE, DPI)
+    lines_needed = int((meters * 100 / 2.54) * DPI / loaded_font.line_height)
+    text = "\n".join(" ".join(WORDS[(i + j) % len(WORDS)] for j in range(6)) for i in range(lines_needed))
+    side_margin_px = int(0.03 * DPI)
+    lines = TextLayout(loaded_font.font, IMAGE_WIDTH_PX - 2 * side_margin_px, loaded_font.glyphs).wrap(text)
+    return draw_lines(lines, loaded_font.font, loaded_font.line_height, IMAGE_WIDTH_PX, side_margin_px, 10, 10)
+
+
+def best_of(repeat: int, run) -> tuple:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = run()
+        times.append(time.perf_counter() - start)
+    return min(times), output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meters", type=float, nargs="+", default=[1, 2, 5])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'meters':>6} {'height':>8} {'pillow 1-bit':>13} {'numpy 1-bit':>12} {'pillow gray':>12} {'numpy gray':>11}")
+    for meters in args.meters:
+        gray = render(meters)
+        bilevel = to_monochrome(gray)
+
+        # From a 1-bit image, and from the grayscale render including the threshold pass
+        pillow_1, expected = best_of(args.repeat, lambda: pillow_bmp(bilevel))
+        numpy_1, packed = best_of(args.repeat, lambda: encode_bmp(bilevel))
+        pillow_gray, _ = best_of(args.repeat, lambda: pillow_bmp(to_monochrome(gray)))
+        numpy_gray, packed_gray = best_of(args.repeat, lambda: encode_bmp(gray, "threshold"))
+        if packed != expected or packed_gray != expected:
+            sys.exit(f"Output differs from Pillow at {meters} m")
+
+        print(f"{meters:>6.1f} {gray.height:>8} {pillow_1:>12.3f}s {numpy_1:>11.3f}s "
+              f"{pillow_gray:>11.3f}s {numpy_gray:>10.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Compare the in-process photo pipeline against the previous ImageMagick shell-outs.
+
+Usage:
+
+    python benchmarks/bench_dither.py [photo ...] [--repeat 5]
+
+Without photos a synthetic gradient/noise image is generated. The magick
+path is skipped when ImageMagick is not installed.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src-pyloid"))
+
+import numpy as np
+from PIL import Image
+
+from imaging import DITHER_METHODS, PHOTO_WIDTH_PX, PRINTER_WIDTH_PX, encode_bmp, prepare_photo
+from render import encode_png
+
+
+def synthetic_photo(width: int = 4000, height: int = 3000) -> Image.Image:
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = (x + y) / 2 + rng.normal(0, 20, (height, width))
+    rgb = np.stack([base, base[::-1], base[:, ::-1]], axis=-1).clip(0, 255).astype(np.uint8)
+    return Image.fromarray(rgb, "RGB")
+
+
+def in_process(path: str, method: str) -> None:
+    with Image.open(path) as image:
+        bilevel = prepare_photo(image, method)
+    encode_png(bilevel)
+    encode_bmp(bilevel)
+
+
+def with_magick(path: str, workdir: str) -> None:
+    """The previous prepare_image_file pipeline"""
+    temp_output = os.path.join(workdir, "temp_output.png")
+    preview_path = os.path.join(workdir, "preview.png")
+    output_bmp = os.path.join(workdir, "output.bmp")
+
+    image = Image.open(path)
+    height = int((PHOTO_WIDTH_PX / image.width) * image.height)
+    resized = image.resize((PHOTO_WIDTH_PX, height), Image.Resampling.LANCZOS)
+    final_image = Image.new('RGB', (PRINTER_WIDTH_PX, height), 'white')
+    final_image.paste(resized, ((PRINTER_WIDTH_PX - PHOTO_WIDTH_PX) // 2, 0))
+    final_image.save(temp_output)
+
+    os.system(f'magick {temp_output} -modulate 120,100,100 -monochrome -colors 2 {preview_path}')
+    os.system(f'magick {temp_output} -modulate 120,100,100 -monochrome -colors 2 -flip BMP3:{output_bmp}')
+    Image.open(output_bmp).load()
+
+
+def timed(func, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("photos", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        photos = args.photos
+        if not photos:
+            path = os.path.join(workdir, "synthetic.jpg")
+            synthetic_photo().save(path, quality=90)
+            photos = [path]
+
+        print(f"{'photo':<24} {'pipeline':<22} {'median ms':>10} {'min ms':>10}")
+        for photo in photos:
+            name = Path(photo).name[:24]
+            runs = [(f"pillow {method}", lambda m=method: in_process(photo, m)) for method in DITHER_METHODS]
+            if shutil.which("magick"):
+                runs.append(("magick", lambda: with_magick(photo, workdir)))
+            else:
+                print(f"{name:<24} {'magick':<22} {'not installed':>10}")
+
+            for label, func in runs:
+                samples = timed(func, args.repeat)
+                print(f"{name:<24} {label:<22} {statistics.median(samples) * 1000:>10.1f} "
+                      f"{min(samples) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
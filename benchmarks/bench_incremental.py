@@ -0,0 +1,74 @@
+"""Time a one-line edit of a long note with the incremental renderer and check its cache hit rate.
+
+The note is rendered once cold, then again after changing one line, as
+the preview does while typing. The edit is expected to be mostly cache
+hits even when the note's strips don't all fit in the cache; the exit
+status is 1 when the hit rate falls below --min-hit-rate. Usage:
+
+    python benchmarks/bench_incremental.py --lines 2000 --chars 40
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src-pyloid"))
+
+from sticker import StickerRenderer
+
+FONT_PATH = str(Path(__file__).resolve().parent.parent / "src-pyloid/assets/SpaceMono-Regular.ttf")
+# The app's defaults
+DPI = 300
+FONT_SIZE = 14
+MARGIN_CM = 0.0
+
+WORDS = "the quick brown fox jumps over a lazy dog while printing receipts all day long".split()
+
+
+def make_note(lines: int, chars: int) -> list:
+    """Distinct lines of roughly the given length"""
+    note = []
+    for i in range(lines):
+        line = f"{i}"
+        j = 0
+        while len(line) < chars:
+            line += " " + WORDS[(i + j) % len(WORDS)]
+            j += 1
+        note.append(line[:chars])
+    return note
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--chars", type=int, default=40, help="characters per line")
+    parser.add_argument("--cache-mb", type=int, default=128, help="paragraph cache budget")
+    parser.add_argument("--min-hit-rate", type=float, default=0.5)
+    args = parser.parse_args()
+
+    renderer = StickerRenderer(FONT_PATH)
+    renderer.paragraph_renderer.max_bytes = args.cache_mb * 1024 * 1024
+    note = make_note(args.lines, args.chars)
+
+    start = time.perf_counter()
+    renderer.render_text("\n".join(note), DPI, FONT_SIZE, MARGIN_CM, incremental=True)
+    cold = time.perf_counter() - start
+    cached = renderer.paragraph_renderer.stats()
+
+    note[len(note) // 2] += " edited"
+    before = renderer.paragraph_renderer.stats()
+    start = time.perf_counter()
+    renderer.render_text("\n".join(note), DPI, FONT_SIZE, MARGIN_CM, incremental=True)
+    edit = time.perf_counter() - start
+    after = renderer.paragraph_renderer.stats()
+
+    hits = after["hits"] - before["hits"]
+    hit_rate = hits / (hits + after["misses"] - before["misses"])
+    print(f"cold render   {cold:>8.3f}s  {cached['paragraphs']} paragraphs cached, {cached['bytes'] / 2 ** 20:.0f} MB")
+    print(f"one-line edit {edit:>8.3f}s  {hit_rate:.0%} cache hits")
+    if hit_rate < args.min_hit_rate:
+        sys.exit(f"Hit rate {hit_rate:.0%} is below {args.min_hit_rate:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Measure print job throughput against the local stand-in IPP printer.
+
+Compares the pooled keep-alive client with opening a new connection per
+job (and ipptool, when installed). Usage:
+
+    python benchmarks/bench_ipp.py --jobs 200 --size-kb 40
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src-pyloid"))
+
+from ipp import IPPClient
+from ipp_server import FakeIPPServer
+
+
+def run_client(url: str, jobs: int, data: bytes, max_connections: int) -> float:
+    client = IPPClient(url, max_connections=max_connections)
+    start = time.perf_counter()
+    for _ in range(jobs):
+        client.print_job(data)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+
+def run_ipptool(url: str, jobs: int, data: bytes) -> float:
+    with tempfile.NamedTemporaryFile(suffix=".bmp", delete=False) as job_file:
+        job_file.write(data)
+    try:
+        start = time.perf_counter()
+        for _ in range(jobs):
+            subprocess.run(['ipptool', '-tv', '-f', job_file.name, url,
+                            '-d', 'fileType=image/reverse-encoding-bmp', 'print-job.test'],
+                           capture_output=True)
+        return time.perf_counter() - start
+    finally:
+        os.remove(job_file.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=40)
+    args = parser.parse_args()
+
+    data = os.urandom(args.size_kb * 1024)
+    server = FakeIPPServer().start()
+    try:
+        runs = [
+            ("pooled keep-alive", lambda: run_client(server.url, args.jobs, data, max_connections=2)),
+            ("new connection/job", lambda: run_client(server.url, args.jobs, data, max_connections=0)),
+        ]
+        if shutil.which("ipptool"):
+            runs.append(("ipptool", lambda: run_ipptool(server.url, args.jobs, data)))
+
+        print(f"{'client':<20} {'jobs/s':>10} {'ms/job':>10} {'connections':>12}")
+        for label, func in runs:
+            connections = server.printer.connections
+            elapsed = func()
+            print(f"{label:<20} {args.jobs / elapsed:>10.1f} {elapsed / args.jobs * 1000:>10.2f} "
+                  f"{server.printer.connections - connections:>12}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
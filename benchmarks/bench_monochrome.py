@@ -0,0 +1,98 @@
+"""Compare peak memory and time of the RGB and monochrome text render pipelines.
+
+Each pipeline runs in a fresh process so peak RSS is not polluted by the
+other run. Usage:
+
+    python benchmarks/bench_monochrome.py --meters 1 2 5
+"""
+import argparse
+import io
+import multiprocessing
+import resource
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src-pyloid"))
+
+FONT_PATH = str(Path(__file__).resolve().parent.parent / "src-pyloid/assets/SpaceMono-Regular.ttf")
+DPI = 203
+FONT_SIZE = 12
+IMAGE_WIDTH_PX = 576
+
+WORDS = "the quick brown fox jumps over a lazy dog while printing receipts all day long".split()
+
+
+def make_text(meters: float, line_height: int) -> str:
+    """Synthetic text long enough to produce roughly the given sticker length"""
+    lines_needed = int((meters * 100 / 2.54) * DPI / line_height)
+    return "\n".join(" ".join(WORDS[(i + j) % len(WORDS)] for j in range(3)) for i in range(lines_needed))
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_pipeline(mode: str, meters: float, queue):
+    from fonts import font_cache
+    from layout import TextLayout
+    from render import draw_lines, to_monochrome
+
+    loaded_font = font_cache.get(FONT_PATH, FONT_SIZE, DPI)
+    side_margin_px = int(0.03 * DPI)
+    margin = int(0.05 * DPI)
+    text = make_text(meters, loaded_font.line_height)
+    lines = TextLayout(loaded_font.font, IMAGE_WIDTH_PX - 2 * side_margin_px, loaded_font.glyphs).wrap(text)
+
+    baseline_rss = peak_rss_mb()
+    start = time.perf_counter()
+
+    if mode == "rgb":
+        # Previous pipeline: RGB canvas, saved as PNG, converted to 1-bit afterwards
+        image = draw_lines(lines, loaded_font.font, loaded_font.line_height, IMAGE_WIDTH_PX,
+                           side_margin_px, margin, margin, mode="RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        image = image.convert("1")
+    else:
+        image = to_monochrome(draw_lines(lines, loaded_font.font, loaded_font.line_height, IMAGE_WIDTH_PX,
+                                         side_margin_px, margin, margin))
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+
+    elapsed = time.perf_counter() - start
+    queue.put({
+        "mode": mode,
+        "meters": meters,
+        "height_px": image.height,
+        "length_m": image.height / DPI * 2.54 / 100,
+        "seconds": elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_growth_mb": peak_rss_mb() - baseline_rss,
+        "png_bytes": buffer.tell(),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meters", type=float, nargs="+", default=[1, 2, 5])
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{'mode':<6} {'meters':>6} {'height':>8} {'seconds':>8} {'rss MB':>8} {'+rss MB':>8} {'png KB':>8}")
+    for meters in args.meters:
+        for mode in ("rgb", "mono"):
+            queue = ctx.Queue()
+            process = ctx.Process(target=run_pipeline, args=(mode, meters, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            print(f"{result['mode']:<6} {result['length_m']:>6.1f} {result['height_px']:>8} "
+                  f"{result['seconds']:>8.2f} {result['peak_rss_mb']:>8.1f} "
+                  f"{result['rss_growth_mb']:>8.1f} {result['png_bytes'] / 1024:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
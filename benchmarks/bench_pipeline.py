@@ -0,0 +1,313 @@
+"""Benchmark every stage of the render and print pipeline on synthetic corpora.
+
+Each (corpus, stage) pair runs in a fresh process, so its peak RSS is not
+polluted by earlier runs. The stage's inputs are built first and only the
+stage itself is timed. Results go to a JSON file that can later serve as a
+baseline. Usage:
+
+    python benchmarks/bench_pipeline.py --output results.json
+    python benchmarks/bench_pipeline.py --baseline results.json --output new.json
+    python benchmarks/bench_pipeline.py --cases short_note log_10k --repeat 5
+
+With --baseline, stages that got slower or hungrier than the thresholds
+are listed and the exit status is 1.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import platform
+import queue as queue_module
+import random
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src-pyloid"))
+
+FONT_PATH = str(Path(__file__).resolve().parent.parent / "src-pyloid/assets/SpaceMono-Regular.ttf")
+DPI = 203
+FONT_SIZE = 12
+MARGIN_CM = 0.5
+SEED = 1234
+
+WORDS = "the quick brown fox jumps over a lazy dog while printing receipts all day long".split()
+LOG_LEVELS = ["DEBUG", "INFO", "INFO", "INFO", "WARNING", "ERROR"]
+CJK = "的一是不了人我在有他这为之大来以个中上们到说国和地也子时道出而要于就下得可你年生自会那后能对着事其里所去行过家十用发天如然作方成者多日都三小义没重"
+
+
+def short_note(rng: random.Random, scale: float) -> str:
+    return "Buy milk\nCall the dentist at 3pm\nPick up the parcel from the post office"
+
+
+def log_10k(rng: random.Random, scale: float) -> str:
+    lines = []
+    for i in range(int(10000 * scale)):
+        message = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 8)))
+        lines.append(f"2024-05-01T12:{i // 60 % 60:02d}:{i % 60:02d}Z {rng.choice(LOG_LEVELS)} worker-{i % 8} {message}")
+    return "\n".join(lines)
+
+
+def giant_token(rng: random.Random, scale: float) -> str:
+    # Hashes, base64 blobs and URLs with no spaces have to be split character by character
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(int(50000 * scale)))
+
+
+def cjk_text(rng: random.Random, scale: float) -> str:
+    # No spaces to break on; Space Mono has no CJK glyphs, which still exercises the measuring path
+    return "\n".join("".join(rng.choice(CJK) for _ in range(rng.randint(20, 400))) for _ in range(int(300 * scale)))
+
+
+def large_photo(rng: random.Random, scale: float) -> bytes:
+    import numpy as np
+    from PIL import Image
+
+    # A 24 megapixel photo-like gradient with noise, JPEG encoded like a camera file
+    height, width = max(int(4000 * scale), 8), max(int(6000 * scale), 8)
+    y, x = np.mgrid[0:height, 0:width]
+    noise = np.random.default_rng(SEED).integers(0, 40, (height, width), dtype=np.uint8)
+    gray = ((x * 200 // width + y * 55 // height) + noise).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(np.dstack([gray, gray[::-1], gray[:, ::-1]])).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def markdown_canvas(rng: random.Random, scale: float) -> bytes:
+    from PIL import Image, ImageDraw
+
+    # What html2canvas hands to store_canvas_data: a wide RGB page of rendered markdown
+    height = max(int(6000 * scale), 100)
+    image = Image.new("RGB", (1152, height), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(20, height, 28):
+        draw.text((20, y), " ".join(rng.choice(WORDS) for _ in range(12)), fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+# Corpus name -> (kind, generator)
+CORPORA = {
+    "short_note": ("text", short_note),
+    "log_10k": ("text", log_10k),
+    "giant_token": ("text", giant_token),
+    "cjk": ("text", cjk_text),
+    "large_photo": ("photo", large_photo),
+    "markdown_canvas": ("canvas", markdown_canvas),
+}
+
+# Stages timed for each kind of corpus; split_long_word only applies to long tokens
+STAGES = {
+    "text": ["layout", "render", "encode_bmp", "encode_png"],
+    "photo": ["prepare_photo", "encode_bmp", "encode_png"],
+    "canvas": ["convert_canvas", "encode_bmp"],
+}
+EXTRA_STAGES = {"giant_token": ["split_long_word"]}
+
+
+def stages_for(case: str) -> list:
+    return STAGES[CORPORA[case][0]] + EXTRA_STAGES.get(case, [])
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def prepare(case: str, stage: str, scale: float):
+    """Build a stage's inputs and return a callable that runs just that stage"""
+    from PIL import Image
+
+    from fonts import font_cache
+    from imaging import encode_bmp, load_photo
+    from layout import TextLayout
+    from render import encode_png
+    from sticker import StickerRenderer, render_canvas, render_photo
+
+    kind, generate = CORPORA[case]
+    corpus = generate(random.Random(SEED), scale)
+
+    if kind == "text":
+        renderer = StickerRenderer(FONT_PATH)
+        loaded_font, side_margin_px, _ = renderer.metrics(DPI, FONT_SIZE, MARGIN_CM)
+        layout = TextLayout(loaded_font.font, 576 - 2 * side_margin_px, loaded_font.glyphs)
+        if stage == "layout":
+            return lambda: layout.wrap(corpus)
+        if stage == "split_long_word":
+            return lambda: layout.split_long_word(corpus)
+        if stage == "render":
+            # Start from cold glyph caches like a fresh app would
+            return lambda: (font_cache.invalidate(), renderer.render_text(corpus, DPI, FONT_SIZE, MARGIN_CM))[1][0]
+        image, _ = renderer.render_text(corpus, DPI, FONT_SIZE, MARGIN_CM)
+    elif kind == "photo":
+        if stage == "prepare_photo":
+            return lambda: render_photo(load_photo(io.BytesIO(corpus)))[0]
+        image, _ = render_photo(load_photo(io.BytesIO(corpus)))
+    else:
+        if stage == "convert_canvas":
+            def run():
+                with Image.open(io.BytesIO(corpus)) as canvas:
+                    return render_canvas(canvas)
+            return run
+        with Image.open(io.BytesIO(corpus)) as canvas:
+            image = render_canvas(canvas)
+
+    if stage == "encode_bmp":
+        return lambda: encode_bmp(image)
+    if stage == "encode_png":
+        return lambda: encode_png(image)
+    raise ValueError(f"Unknown stage {stage} for {case}")
+
+
+def describe_output(output) -> dict:
+    """Size of a stage's result: bytes for encoded data, pixels or lines otherwise"""
+    if isinstance(output, (bytes, bytearray)):
+        return {"output_bytes": len(output)}
+    if isinstance(output, list):
+        return {"output_lines": len(output)}
+    if hasattr(output, "size"):
+        return {"output_width": output.size[0], "output_height": output.size[1]}
+    return {}
+
+
+def run_stage(case: str, stage: str, repeat: int, scale: float, queue):
+    try:
+        run = prepare(case, stage, scale)
+        baseline_rss = peak_rss_mb()
+
+        times = []
+        output = None
+        for _ in range(repeat):
+            output = None  # Don't hold the previous result while producing the next
+            start = time.perf_counter()
+            output = run()
+            times.append(time.perf_counter() - start)
+
+        queue.put({
+            "case": case,
+            "stage": stage,
+            "seconds": min(times),
+            "median_seconds": statistics.median(times),
+            "repeat": repeat,
+            "peak_rss_mb": peak_rss_mb(),
+            "stage_rss_mb": peak_rss_mb() - baseline_rss,
+            **describe_output(output),
+        })
+    except Exception as e:
+        queue.put({"case": case, "stage": stage, "error": f"{type(e).__name__}: {e}"})
+
+
+def measure(case: str, stage: str, repeat: int, scale: float, timeout: float) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=run_stage, args=(case, stage, repeat, scale, queue))
+    process.start()
+
+    # A stage that crashes or is OOM-killed never reports, poll so it can't hang the suite
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            result = queue.get(timeout=1.0)
+            break
+        except queue_module.Empty:
+            if process.exitcode is not None:
+                # Exited without a result; give a result still in the pipe a moment to arrive
+                try:
+                    result = queue.get(timeout=1.0)
+                except queue_module.Empty:
+                    result = {"case": case, "stage": stage, "error": f"worker exited with code {process.exitcode}"}
+                break
+            if time.monotonic() > deadline:
+                process.kill()
+                result = {"case": case, "stage": stage, "error": f"timed out after {timeout:g}s"}
+                break
+    process.join()
+    return result
+
+
+def environment(scale: float) -> dict:
+    import numpy
+    import PIL
+
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "scale": scale,
+    }
+
+
+def compare(results: list, baseline: dict, time_threshold: float, rss_threshold: float) -> list:
+    """Stages whose time or stage memory grew past the thresholds (ratios) relative to the baseline"""
+    previous = {(r["case"], r["stage"]): r for r in baseline["results"] if "error" not in r}
+    regressions = []
+    for result in results:
+        before = previous.get((result["case"], result["stage"]))
+        if before is None or "error" in result:
+            continue
+        time_ratio = result["seconds"] / max(before["seconds"], 1e-9)
+        # Ignore memory noise below a couple of MB
+        rss_ratio = max(result["stage_rss_mb"], 2.0) / max(before["stage_rss_mb"], 2.0)
+        result["time_ratio"] = round(time_ratio, 3)
+        result["rss_ratio"] = round(rss_ratio, 3)
+        # Sub-millisecond differences are timer noise whatever the ratio
+        slower = time_ratio > time_threshold and result["seconds"] - before["seconds"] > 0.001
+        if slower or rss_ratio > rss_threshold:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--cases", nargs="+", choices=list(CORPORA), default=list(CORPORA))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the fastest is reported")
+    parser.add_argument("--scale", type=float, default=1.0, help="corpus size factor, e.g. 0.1 for a quick run")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds before a stage is given up on")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--time-threshold", type=float, default=1.15, help="slowdown ratio that counts as a regression")
+    parser.add_argument("--rss-threshold", type=float, default=1.25, help="memory growth ratio that counts as a regression")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'case':<16} {'stage':<16} {'seconds':>9} {'stage RSS':>10} {'output':>12}")
+    for case in args.cases:
+        for stage in stages_for(case):
+            result = measure(case, stage, args.repeat, args.scale, args.timeout)
+            results.append(result)
+            if "error" in result:
+                print(f"{case:<16} {stage:<16} {result['error']}")
+                continue
+            output = result.get("output_bytes", result.get("output_lines", result.get("output_height", "")))
+            print(f"{case:<16} {stage:<16} {result['seconds']:>9.4f} {result['stage_rss_mb']:>8.1f}MB {output:>12}")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["environment"].get("scale", 1.0) != args.scale:
+            parser.error(f"baseline was measured with --scale {baseline['environment'].get('scale', 1.0)}")
+        regressions = compare(results, baseline, args.time_threshold, args.rss_threshold)
+        print()
+        if regressions:
+            print("Regressions against baseline:")
+            for r in regressions:
+                print(f"  {r['case']}/{r['stage']}: time x{r['time_ratio']}, stage RSS x{r['rss_ratio']}")
+        else:
+            print("No regressions against baseline")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(args.scale), "results": results}, f, indent=2)
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
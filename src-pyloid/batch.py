@@ -0,0 +1,209 @@
+"""Render stickers in bulk without the app window.
+
+Usage:
+
+    python src-pyloid/batch.py labels.csv --out stickers/ --format png
+    python src-pyloid/batch.py labels.jsonl --printer ipp://printer.local:631/ipp/print
+    python src-pyloid/batch.py labels.csv --printer ipp://a.local:631/ipp/print --printer ipp://b.local:631/ipp/print
+
+Each input row is one sticker. CSV files need a header row, JSONL files one
+object per line. Recognised fields are text or image (a photo path), and
+optionally name (the file name), font_size, dpi and margin_cm to override
+the command line defaults. Rendering runs in a process pool; one JSON line per item with its
+timing is written to stdout. With several printers, stickers are spread
+over them like a printer pool does in the app.
+"""
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+from imaging import DITHER_METHODS, MAX_PHOTO_PIXELS, encode_bmp, load_photo
+from ipp import DOCUMENT_FORMAT
+from printer_pools import STRATEGIES, PrinterPool
+from printing import PrintError, submit_job
+from render import encode_png
+from sticker import StickerRenderer, render_photo
+
+_renderer = None  # One per worker process, so fonts are loaded once per process
+
+
+def _init_worker(font_path: str):
+    global _renderer
+    _renderer = StickerRenderer(font_path)
+
+
+def read_items(path: str) -> list:
+    """Items of a CSV or JSONL file as dicts"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            return [json.loads(line) for line in f if line.strip()]
+        return list(csv.DictReader(f))
+
+
+def field(item: dict, key: str, default):
+    """An item's value for key, or default when the field is missing or empty"""
+    value = item.get(key)
+    return default if value is None or value == "" else value
+
+
+def file_name(item: dict, index: int) -> str:
+    """The item's name as a plain file name, or its index if it has no usable name"""
+    # Names come from the feed, so they must not reach outside the output directory
+    name = os.path.basename(str(field(item, "name", "")).replace("\\", "/")).strip()
+    return name if name not in ("", ".", "..") else f"{index:06d}"
+
+
+def render_item(index: int, item: dict, options: dict) -> dict:
+    """Render one item to BMP or PNG bytes and time it"""
+    started = time.perf_counter()
+    name = file_name(item, index)
+    try:
+        if item.get("image"):
+            photo = load_photo(item["image"], max_pixels=options["max_pixels"])
+            image, length_cm = render_photo(photo, options["dither"])
+        else:
+            image, length_cm = _renderer.render_text(
+                str(field(item, "text", "")),
+                int(field(item, "dpi", options["dpi"])),
+                int(field(item, "font_size", options["font_size"])),
+                float(field(item, "margin_cm", options["margin_cm"])),
+            )
+        data = encode_png(image) if options["format"] == "png" else encode_bmp(image)
+    except Exception as e:
+        return {"index": index, "name": name, "error": str(e),
+                "render_seconds": time.perf_counter() - started}
+
+    return {
+        "index": index,
+        "name": name,
+        "data": data,
+        "length_cm": round(length_cm, 2),
+        "render_seconds": time.perf_counter() - started,
+    }
+
+
+def save_item(result: dict, options: dict, submit) -> dict:
+    """Write a rendered item to its file or send it to the printer"""
+    data = result.pop("data", None)
+    if data is None:
+        return result
+
+    started = time.perf_counter()
+    try:
+        if options["printers"]:
+            result["job_id"] = submit(data)
+        else:
+            path = os.path.join(options["out"], f"{result['name']}.{options['format']}")
+            with open(path, "wb") as f:
+                f.write(data)
+            result["path"] = path
+    except (PrintError, OSError) as e:
+        result["error"] = str(e)
+    result["output_seconds"] = time.perf_counter() - started
+    return result
+
+
+def run(items: list, options: dict, font_path: str = None, workers: int = None, report=None):
+    """Render all items in parallel and save or print them, reporting in input order; returns the results"""
+    results = []
+    workers = workers or os.cpu_count() or 1
+
+    printers = options["printers"]
+    if len(printers) > 1:
+        # Several printers print at the same time, each job on the least busy healthy one
+        pool = PrinterPool("batch", printers, options.get("strategy", "least-loaded"))
+        submit, output_workers = pool.submit, len(printers)
+    else:
+        submit, output_workers = (lambda data: submit_job(printers[0], data, DOCUMENT_FORMAT)), 1
+
+    def finish(result):
+        results.append(result)
+        if report:
+            report(result)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(font_path,)) as executor, \
+            ThreadPoolExecutor(max_workers=output_workers) as output:
+        # Keep a few items per worker in flight so rendered documents don't pile up in memory
+        pending = deque()
+        queued = enumerate(items)
+        for index, item in itertools.islice(queued, workers * 4):
+            pending.append(executor.submit(render_item, index, item, options))
+
+        saving = deque()
+        names = set()
+        while pending:
+            result = pending.popleft().result()
+            for index, item in itertools.islice(queued, 1):
+                pending.append(executor.submit(render_item, index, item, options))
+
+            # Items sharing a name would overwrite each other's file
+            if result["name"] in names:
+                result["name"] = f"{result['name']}-{result['index']:06d}"
+            names.add(result["name"])
+            saving.append(output.submit(save_item, result, options, submit))
+
+            # Report finished items in order, without letting more than a couple per printer wait
+            while saving and (saving[0].done() or len(saving) > 2 * output_workers):
+                finish(saving.popleft().result())
+
+        while saving:
+            finish(saving.popleft().result())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render sticky notes in bulk")
+    parser.add_argument("input", help="CSV or JSONL file, one sticker per row")
+    parser.add_argument("--out", default=".", help="directory for rendered files")
+    parser.add_argument("--format", choices=("bmp", "png"), default="bmp")
+    parser.add_argument("--printer", action="append", default=[],
+                        help="print to this printer URL instead of writing files; repeat to spread over several")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="least-loaded",
+                        help="how jobs are spread over several printers")
+    parser.add_argument("--font", help="font file (defaults to Space Mono)")
+    parser.add_argument("--font-size", type=int, default=14)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--margin-cm", type=float, default=0.0)
+    parser.add_argument("--dither", choices=DITHER_METHODS, default="floyd-steinberg")
+    parser.add_argument("--max-megapixels", type=float, default=MAX_PHOTO_PIXELS / 1_000_000,
+                        help="refuse photos that would decode to more pixels than this")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.printer and args.format != "bmp":
+        parser.error("--printer sends BMP, --format png only applies to files")
+    if not args.printer:
+        os.makedirs(args.out, exist_ok=True)
+
+    options = {
+        "format": args.format,
+        "printers": args.printer,
+        "strategy": args.strategy,
+        "out": args.out,
+        "font_size": args.font_size,
+        "dpi": args.dpi,
+        "margin_cm": args.margin_cm,
+        "dither": args.dither,
+        "max_pixels": int(args.max_megapixels * 1_000_000),
+    }
+
+    def report(result):
+        print(json.dumps(result), flush=True)
+
+    started = time.perf_counter()
+    results = run(read_items(args.input), options, args.font, args.workers, report)
+    elapsed = time.perf_counter() - started
+
+    failed = sum(1 for result in results if "error" in result)
+    print(f"{len(results) - failed} stickers done, {failed} failed in {elapsed:.2f}s", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
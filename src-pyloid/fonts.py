@@ -0,0 +1,76 @@
+"""Process-wide cache of loaded fonts and their metrics"""
+from collections import OrderedDict
+import threading
+
+from PIL import ImageFont
+
+from layout import GlyphCache
+
+
+class LoadedFont:
+    """A FreeType font at a given size and DPI, with its derived metrics"""
+
+    def __init__(self, font_path: str, font_size: int, dpi: int):
+        self.font_path = font_path
+        self.font_size = font_size
+        self.dpi = dpi
+
+        # Scale font size with DPI
+        self.scaled_size = int(font_size * (dpi / 72))
+        self.font = ImageFont.truetype(font_path, self.scaled_size)
+        self.line_height = self.font.getbbox("A")[3]
+        self.glyphs = GlyphCache(self.font)
+
+
+class FontCache:
+    """Bounded LRU of LoadedFont objects keyed by (font path, size, DPI)"""
+
+    def __init__(self, maxsize: int = 16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fonts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, font_path: str, font_size: int, dpi: int) -> LoadedFont:
+        """Get a loaded font, loading it on a miss"""
+        key = (font_path, font_size, dpi)
+        with self._lock:
+            loaded = self._fonts.get(key)
+            if loaded is not None:
+                self._fonts.move_to_end(key)
+                self.hits += 1
+                return loaded
+            self.misses += 1
+
+        # Load outside the lock; a concurrent miss just loads twice
+        loaded = LoadedFont(font_path, font_size, dpi)
+
+        with self._lock:
+            self._fonts[key] = loaded
+            self._fonts.move_to_end(key)
+            while len(self._fonts) > self.maxsize:
+                self._fonts.popitem(last=False)
+        return loaded
+
+    def invalidate(self, font_path: str = None):
+        """Drop cached fonts, either all of them or only those for font_path"""
+        with self._lock:
+            if font_path is None:
+                self._fonts.clear()
+            else:
+                for key in [k for k in self._fonts if k[0] == font_path]:
+                    del self._fonts[key]
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._fonts),
+                "maxsize": self.maxsize,
+            }
+
+
+font_cache = FontCache()
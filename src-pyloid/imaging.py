@@ -0,0 +1,199 @@
+"""In-process conversion of photos to printer-ready 1-bit images"""
+import math
+import struct
+
+import numpy as np
+from PIL import Image
+
+from render import THRESHOLD, to_monochrome
+
+PRINTER_WIDTH_PX = 576  # Fixed width for thermal printer
+PHOTO_WIDTH_PX = 500  # Photos are centered with a little padding on each side
+
+DITHER_METHODS = ("threshold", "floyd-steinberg", "bayer")
+
+BMP_CHUNK_ROWS = 8192  # Rows packed at a time; a multiple of the Bayer matrix size
+MAX_PHOTO_PIXELS = 64_000_000  # Largest decoded photo, after any reduced decoding
+
+# EXIF orientation -> transpose that makes the photo upright
+ORIENTATIONS = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+class PhotoTooLarge(Exception):
+    pass
+
+
+def _bayer_matrix(size: int) -> np.ndarray:
+    """Ordered dither matrix of the given power-of-two size, values 0..size*size-1"""
+    matrix = np.zeros((1, 1), dtype=np.int32)
+    while matrix.shape[0] < size:
+        matrix = np.block([
+            [4 * matrix, 4 * matrix + 2],
+            [4 * matrix + 3, 4 * matrix + 1],
+        ])
+    return matrix
+
+
+def _bayer_white(pixels: np.ndarray, size: int = 8) -> np.ndarray:
+    height, width = pixels.shape
+
+    # Scale the matrix to thresholds centred in each 0..255 bucket
+    thresholds = ((_bayer_matrix(size) + 0.5) * (256 / (size * size))).astype(np.uint16)
+    tiled = np.tile(thresholds, (height // size + 1, width // size + 1))[:height, :width]
+    return pixels >= tiled
+
+
+def dither(gray: Image.Image, method: str = "floyd-steinberg", threshold: int = 128) -> Image.Image:
+    """Reduce a grayscale image to 1-bit using the given dithering method"""
+    if gray.mode != "L":
+        gray = gray.convert("L")
+    if method == "threshold":
+        return to_monochrome(gray, threshold)
+    if method == "floyd-steinberg":
+        return gray.convert("1", dither=Image.Dither.FLOYDSTEINBERG)
+    if method == "bayer":
+        return Image.fromarray(_bayer_white(np.asarray(gray, dtype=np.uint8)))
+    raise ValueError(f"Unknown dither method: {method}")
+
+
+def white_pixels(image, method: str = "floyd-steinberg", threshold: int = THRESHOLD) -> np.ndarray:
+    """Pixels of an image as booleans, True where the paper stays white.
+
+    1-bit images are taken as they are. Anything else (an image or a uint8
+    array) is reduced with the dithering method, exactly like dither() but
+    vectorized for threshold and Bayer.
+    """
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    if image.mode == "1":
+        return np.asarray(image)
+    if method == "floyd-steinberg":
+        # Error diffusion is sequential, Pillow's C loop is as fast as it gets
+        return np.asarray(image.convert("1"))
+    pixels = np.asarray(image if image.mode == "L" else image.convert("L"))
+    if method == "threshold":
+        return pixels >= threshold
+    if method == "bayer":
+        return _bayer_white(pixels)
+    raise ValueError(f"Unknown dither method: {method}")
+
+
+def load_photo(source, width: int = PHOTO_WIDTH_PX, max_pixels: int = MAX_PHOTO_PIXELS) -> Image.Image:
+    """Decode a photo upright and only about twice as large as needed for `width`.
+
+    JPEGs are decoded at a reduced DCT scale (and straight to grayscale) and
+    other formats are box-reduced, so memory and time follow the output size
+    rather than the camera's. The final LANCZOS pass in prepare_photo still
+    has enough pixels to stay sharp. Photos that would decode to more than
+    `max_pixels` are refused before decoding.
+    """
+    with Image.open(source) as image:
+        orientation = image.getexif().get(0x0112, 1)
+        # A quarter turn swaps which stored side ends up across the paper
+        stored_width = image.height if orientation in (5, 6, 7, 8) else image.width
+        scale = min(1.0, 2 * width / stored_width)
+        wanted = (max(1, math.ceil(image.width * scale)), max(1, math.ceil(image.height * scale)))
+
+        if image.format == "JPEG":
+            image.draft("L", wanted)
+        if image.width * image.height > max_pixels:
+            raise PhotoTooLarge(
+                f"Image is too large ({image.width}x{image.height}, limit {max_pixels / 1_000_000:g} MP)"
+            )
+
+        # reduce() works on the usual photo modes only; palette and odd modes go through RGB like before
+        photo = image if image.mode in ("L", "LA", "RGB", "RGBA", "CMYK", "I", "F") else image.convert("RGB")
+        factor = min(photo.width // wanted[0], photo.height // wanted[1])
+        if factor >= 2:
+            photo = photo.reduce(factor)
+        if orientation in ORIENTATIONS:
+            photo = photo.transpose(ORIENTATIONS[orientation])
+        photo.load()
+        return photo
+
+
+def brighten(gray: Image.Image, percent: int = 120) -> Image.Image:
+    """Scale lightness like `magick -modulate <percent>,100,100` does for gray pixels"""
+    factor = percent / 100
+    return gray.point([min(255, round(v * factor)) for v in range(256)])
+
+
+def prepare_photo(image: Image.Image, method: str = "floyd-steinberg", threshold: int = 128,
+                  brightness: int = 120) -> Image.Image:
+    """Resize, center and dither a photo into a 1-bit image the width of the printer"""
+    # Resize to a narrower width and center it on a white canvas of the printer width
+    height = int((PHOTO_WIDTH_PX / image.width) * image.height)
+    resized = image.convert("RGB").resize((PHOTO_WIDTH_PX, height), Image.Resampling.LANCZOS)
+
+    canvas = Image.new("L", (PRINTER_WIDTH_PX, height), 255)
+    canvas.paste(resized.convert("L"), ((PRINTER_WIDTH_PX - PHOTO_WIDTH_PX) // 2, 0))
+
+    return dither(brighten(canvas, brightness), method, threshold)
+
+
+def _pack_rows(image: Image.Image, rows: np.ndarray, method: str, threshold: int):
+    """Pack an image into preallocated, padded 1-bpp rows, a chunk of rows at a time"""
+    if image.mode != "1" and method == "floyd-steinberg":
+        image = image.convert("1")  # Error diffusion has to see the whole image at once
+    row_bytes = (image.width + 7) // 8
+    for top in range(0, image.height, BMP_CHUNK_ROWS):
+        chunk = image.crop((0, top, image.width, min(image.height, top + BMP_CHUNK_ROWS)))
+        rows[top:top + chunk.height, :row_bytes] = np.packbits(white_pixels(chunk, method, threshold), axis=1)
+
+
+def encode_bmp(image: Image.Image, method: str = "floyd-steinberg", threshold: int = THRESHOLD) -> bytes:
+    """Encode an image as the vertically flipped 1-bit BMP3 the printer expects.
+
+    1-bit images are packed as they are; anything else is dithered with
+    `method` on the way, like convert("1") would by default. The rows of a
+    flipped BMP are stored top row first, so they are written in order
+    straight into the file's buffer.
+    """
+    header = bmp_header(image.width, image.height)
+    stride = ((image.width + 7) // 8 + 3) & ~3
+    buffer = bytearray(len(header) + stride * image.height)
+    buffer[:len(header)] = header
+    rows = np.frombuffer(buffer, dtype=np.uint8, offset=len(header)).reshape(image.height, stride)
+    _pack_rows(image, rows, method, threshold)
+    return bytes(buffer)
+
+
+def bmp_header(width: int, height: int, dpi: tuple = (96, 96)) -> bytes:
+    """File and info headers of a 1-bit BMP3, as Pillow writes them"""
+    stride = ((width + 7) // 8 + 3) & ~3
+    offset = 14 + 40 + 2 * 4
+    ppm = tuple(int(x * 39.3701 + 0.5) for x in dpi)
+    return (
+        b"BM" + struct.pack("<IIIIiiHHIIiiII", offset + stride * height, 0, offset,
+                            40, width, height, 1, 1, 0, stride * height, ppm[0], ppm[1], 2, 2)
+        + b"\x00\x00\x00\x00\xff\xff\xff\x00"  # Palette: black, white
+    )
+
+
+def bmp_rows(image: Image.Image, method: str = "floyd-steinberg", threshold: int = THRESHOLD) -> bytes:
+    """Pixel rows of an image in flipped-BMP storage order (top row first), padded"""
+    stride = ((image.width + 7) // 8 + 3) & ~3
+    rows = np.zeros((image.height, stride), dtype=np.uint8)
+    _pack_rows(image, rows, method, threshold)
+    return rows.tobytes()
+
+
+def stream_bmp(bands, width: int, height: int, method: str = "floyd-steinberg", threshold: int = THRESHOLD):
+    """Yield a flipped 1-bit BMP chunk by chunk from bands rendered top to bottom.
+
+    A flipped image stored bottom-up puts the original top row first, so the
+    file can be written as bands are rendered once the total height is known.
+    Grayscale bands are reduced with `method`; error diffusion restarts at
+    each band, so pass 1-bit bands or another method for seamless output.
+    """
+    yield bmp_header(width, height)
+    for band in bands:
+        yield bmp_rows(band, method, threshold)
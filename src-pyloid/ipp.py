@@ -0,0 +1,286 @@
+"""Minimal IPP/1.1 client with keep-alive connection pooling"""
+from collections import deque
+import getpass
+import http.client
+import itertools
+import struct
+import threading
+from urllib.parse import urlsplit
+
+# Operations
+PRINT_JOB = 0x0002
+GET_PRINTER_ATTRIBUTES = 0x000B
+
+# Delimiter tags
+OPERATION_ATTRIBUTES = 0x01
+JOB_ATTRIBUTES = 0x02
+END_OF_ATTRIBUTES = 0x03
+PRINTER_ATTRIBUTES = 0x04
+UNSUPPORTED_ATTRIBUTES = 0x05
+
+# Value tags
+INTEGER = 0x21
+BOOLEAN = 0x22
+ENUM = 0x23
+TEXT = 0x41
+NAME = 0x42
+KEYWORD = 0x44
+URI = 0x45
+CHARSET = 0x47
+NATURAL_LANGUAGE = 0x48
+MIME_MEDIA_TYPE = 0x49
+
+DOCUMENT_FORMAT = "image/reverse-encoding-bmp"
+
+
+class IPPError(Exception):
+    """The printer could not be reached or rejected the request"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class IPPResponse:
+    """Decoded IPP response: status code and attributes grouped by tag"""
+
+    def __init__(self, version: tuple, status_code: int, request_id: int, groups: list):
+        self.version = version
+        self.status_code = status_code
+        self.request_id = request_id
+        self.groups = groups  # [(group tag, {name: [values]})]
+
+    @property
+    def ok(self) -> bool:
+        # successful-ok and its informational variants
+        return self.status_code < 0x0100
+
+    def get(self, name: str, default=None):
+        """First value of an attribute in any group"""
+        for _, attributes in self.groups:
+            if name in attributes:
+                return attributes[name][0]
+        return default
+
+    @property
+    def job_id(self) -> int:
+        return self.get("job-id")
+
+    @property
+    def status_message(self) -> str:
+        return self.get("status-message", f"status 0x{self.status_code:04x}")
+
+
+def encode_attribute(tag: int, name: str, value) -> bytes:
+    """Encode one attribute (name may be empty for additional values)"""
+    if tag in (INTEGER, ENUM):
+        data = struct.pack(">i", value)
+    elif tag == BOOLEAN:
+        data = b"\x01" if value else b"\x00"
+    else:
+        data = value.encode("utf-8")
+    name_bytes = name.encode("utf-8")
+    return struct.pack(">BH", tag, len(name_bytes)) + name_bytes + struct.pack(">H", len(data)) + data
+
+
+def encode_request(operation: int, request_id: int, attributes: list, data: bytes = b"") -> bytes:
+    """Encode an IPP/1.1 request with operation attributes [(tag, name, value)]"""
+    body = bytearray(struct.pack(">BBHI", 1, 1, operation, request_id))
+    body.append(OPERATION_ATTRIBUTES)
+    for tag, name, value in attributes:
+        body += encode_attribute(tag, name, value)
+    body.append(END_OF_ATTRIBUTES)
+    return bytes(body) + data
+
+
+def decode_message(payload: bytes):
+    """Decode an IPP message into (version, code, request id, groups, document data)"""
+    if len(payload) < 9:
+        raise IPPError("Truncated IPP message")
+    major, minor, code, request_id = struct.unpack_from(">BBHI", payload, 0)
+    offset = 8
+    groups = []
+    attributes = None
+    name = None
+
+    while offset < len(payload):
+        tag = payload[offset]
+        offset += 1
+        if tag == END_OF_ATTRIBUTES:
+            break
+        if tag < 0x10:
+            attributes = {}
+            groups.append((tag, attributes))
+            continue
+        if attributes is None:
+            raise IPPError("Attribute outside of a group")
+
+        if offset + 2 > len(payload):
+            raise IPPError("Truncated IPP message")
+        name_length, = struct.unpack_from(">H", payload, offset)
+        offset += 2
+        if name_length:
+            name = payload[offset:offset + name_length].decode("utf-8", "replace")
+            offset += name_length
+        if offset + 2 > len(payload):
+            raise IPPError("Truncated IPP message")
+        value_length, = struct.unpack_from(">H", payload, offset)
+        offset += 2
+        if offset + value_length > len(payload):
+            raise IPPError("Truncated IPP message")
+        raw = payload[offset:offset + value_length]
+        offset += value_length
+
+        if tag in (INTEGER, ENUM) and value_length == 4:
+            value = struct.unpack(">i", raw)[0]
+        elif tag == BOOLEAN:
+            value = raw != b"\x00"
+        elif 0x40 <= tag <= 0x4F:
+            value = raw.decode("utf-8", "replace")
+        else:
+            value = raw
+        attributes.setdefault(name, []).append(value)
+
+    return (major, minor), code, request_id, groups, payload[offset:]
+
+
+def http_target(printer_url: str) -> tuple:
+    """(scheme, host, port, path) of an ipp:// or ipps:// URL"""
+    parts = urlsplit(printer_url)
+    if parts.scheme not in ("ipp", "ipps", "http", "https"):
+        raise IPPError(f"Unsupported printer URL: {printer_url}")
+    secure = parts.scheme in ("ipps", "https")
+    return ("https" if secure else "http"), parts.hostname, parts.port or 631, parts.path or "/"
+
+
+class IPPClient:
+    """IPP client for one printer, reusing a small pool of HTTP connections"""
+
+    def __init__(self, printer_url: str, max_connections: int = 2, timeout: float = 30):
+        self.printer_url = printer_url
+        self.scheme, self.host, self.port, self.path = http_target(printer_url)
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.max_connections:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+    def request(self, operation: int, attributes: list, data=b"") -> IPPResponse:
+        """Send a request and return the decoded response.
+
+        data is either the document as bytes or an iterable of byte chunks,
+        which is sent with chunked transfer encoding as it is produced.
+        """
+        request_id = next(self._request_ids)
+        body = encode_request(operation, request_id, [
+            (CHARSET, "attributes-charset", "utf-8"),
+            (NATURAL_LANGUAGE, "attributes-natural-language", "en"),
+            (URI, "printer-uri", self.printer_url),
+        ] + attributes)
+        headers = {"Content-Type": "application/ipp"}
+
+        streaming = not isinstance(data, (bytes, bytearray))
+        if streaming:
+            body = itertools.chain([body], data)
+        else:
+            body += data
+
+        while True:
+            # A stream can't be replayed, so never risk it on a stale keep-alive connection
+            connection, reused = (self._connect(), False) if streaming else self._acquire()
+            try:
+                connection.request("POST", self.path, body, headers)
+                response = connection.getresponse()
+                payload = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                connection.close()
+                if reused:
+                    # The printer dropped an idle keep-alive connection, retry on a fresh one
+                    continue
+                raise IPPError(f"Connection to printer lost: {e}")
+            except OSError as e:
+                connection.close()
+                raise IPPError(f"Cannot reach printer: {e}")
+            except http.client.HTTPException as e:
+                connection.close()
+                raise IPPError(f"Bad response from printer: {e!r}")
+            except BaseException:
+                # E.g. a streamed document failing to render; the request is half sent
+                connection.close()
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+        if response.status != 200:
+            raise IPPError(f"HTTP {response.status} {response.reason}")
+
+        version, status_code, response_id, groups, _ = decode_message(payload)
+        return IPPResponse(version, status_code, response_id, groups)
+
+    def print_job(self, data, document_format: str = DOCUMENT_FORMAT, job_name: str = "ASSNP") -> IPPResponse:
+        """Submit a document (bytes or byte chunks) with Print-Job, raising IPPError unless the printer accepts it"""
+        response = self.request(PRINT_JOB, [
+            (NAME, "requesting-user-name", _user_name()),
+            (NAME, "job-name", job_name),
+            (MIME_MEDIA_TYPE, "document-format", document_format),
+        ], data)
+        if not response.ok:
+            raise IPPError(response.status_message, response.status_code)
+        return response
+
+    def get_printer_attributes(self) -> IPPResponse:
+        """Query the printer's attributes, raising IPPError on failure"""
+        response = self.request(GET_PRINTER_ATTRIBUTES, [
+            (NAME, "requesting-user-name", _user_name()),
+        ])
+        if not response.ok:
+            raise IPPError(response.status_message, response.status_code)
+        return response
+
+
+def _user_name() -> str:
+    try:
+        return getpass.getuser()
+    except Exception:
+        return "assnp"
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(printer_url: str) -> IPPClient:
+    """Shared client (and connection pool) for a printer URL"""
+    with _clients_lock:
+        client = _clients.get(printer_url)
+        if client is None:
+            client = _clients[printer_url] = IPPClient(printer_url)
+        return client
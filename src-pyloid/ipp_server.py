@@ -0,0 +1,179 @@
+"""Local stand-in IPP printer for measuring job throughput without hardware.
+
+Usage:
+
+    python src-pyloid/ipp_server.py --port 8631 --latency 0.05
+
+then print to ipp://localhost:8631/ipp/print.
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import random
+import struct
+import threading
+import time
+
+from ipp import (
+    CHARSET,
+    ENUM,
+    GET_PRINTER_ATTRIBUTES,
+    INTEGER,
+    JOB_ATTRIBUTES,
+    KEYWORD,
+    NATURAL_LANGUAGE,
+    OPERATION_ATTRIBUTES,
+    PRINT_JOB,
+    PRINTER_ATTRIBUTES,
+    TEXT,
+    URI,
+    decode_message,
+    encode_attribute,
+)
+
+# Status codes
+SUCCESSFUL_OK = 0x0000
+SERVER_ERROR_INTERNAL_ERROR = 0x0500
+SERVER_ERROR_OPERATION_NOT_SUPPORTED = 0x0501
+
+
+class FakePrinter:
+    """State shared by all request handlers of one fake printer"""
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, fail_all: bool = False):
+        self.latency = latency  # Seconds spent "printing" each job
+        self.failure_rate = failure_rate
+        self.fail_all = fail_all
+        self.jobs = []  # (job id, document format, document bytes)
+        self.connections = 0
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def print_job(self, attributes: dict, document: bytes) -> tuple:
+        """Accept a job and return (status code, job id)"""
+        time.sleep(self.latency)
+        if self.fail_all or random.random() < self.failure_rate:
+            return SERVER_ERROR_INTERNAL_ERROR, None
+        with self._lock:
+            job_id = next(self._job_ids)
+            self.jobs.append((job_id, attributes.get("document-format", [None])[0], document))
+        return SUCCESSFUL_OK, job_id
+
+
+def _response(status_code: int, request_id: int, groups: list) -> bytes:
+    body = bytearray(struct.pack(">BBHI", 1, 1, status_code, request_id))
+    body.append(OPERATION_ATTRIBUTES)
+    body += encode_attribute(CHARSET, "attributes-charset", "utf-8")
+    body += encode_attribute(NATURAL_LANGUAGE, "attributes-natural-language", "en")
+    for tag, attributes in groups:
+        body.append(tag)
+        for value_tag, name, value in attributes:
+            body += encode_attribute(value_tag, name, value)
+    body.append(0x03)
+    return bytes(body)
+
+
+class IPPRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like a real printer
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.printer._lock:
+            self.server.printer.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if size == 0:
+                # Skip trailers up to the blank line
+                while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    def do_POST(self):
+        payload = self._read_body()
+        printer = self.server.printer
+
+        _, operation, request_id, groups, document = decode_message(payload)
+        operation_attributes = groups[0][1] if groups else {}
+
+        if operation == PRINT_JOB:
+            status_code, job_id = printer.print_job(operation_attributes, document)
+            groups = []
+            if job_id is not None:
+                groups.append((JOB_ATTRIBUTES, [
+                    (INTEGER, "job-id", job_id),
+                    (URI, "job-uri", f"ipp://localhost:{self.server.server_port}/jobs/{job_id}"),
+                    (ENUM, "job-state", 9),  # completed
+                ]))
+            else:
+                groups.append((OPERATION_ATTRIBUTES, [(TEXT, "status-message", "Printer error")]))
+        elif operation == GET_PRINTER_ATTRIBUTES:
+            status_code = SUCCESSFUL_OK
+            groups = [(PRINTER_ATTRIBUTES, [
+                (ENUM, "printer-state", 3),  # idle
+                (KEYWORD, "printer-state-reasons", "none"),
+            ])]
+        else:
+            status_code = SERVER_ERROR_OPERATION_NOT_SUPPORTED
+            groups = []
+
+        body = _response(status_code, request_id, groups)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/ipp")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeIPPServer(ThreadingHTTPServer):
+    """Threaded HTTP server speaking just enough IPP for Print-Job"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, printer: FakePrinter = None):
+        super().__init__((host, port), IPPRequestHandler)
+        self.printer = printer or FakePrinter()
+
+    @property
+    def url(self) -> str:
+        return f"ipp://{self.server_address[0]}:{self.server_port}/ipp/print"
+
+    def start(self) -> "FakeIPPServer":
+        """Serve in a background thread"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake IPP sticky note printer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8631)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per job")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeIPPServer(args.host, args.port, FakePrinter(args.latency, args.failure_rate))
+    print(f"Fake printer listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Text layout engine used to wrap text for the sticker width"""
+from bisect import bisect_right
+from itertools import accumulate
+
+from PIL import ImageFont
+
+
+class GlyphCache:
+    """Cached advance widths for a single (font path, size) pair.
+
+    Single characters and whole words are memoized. Cumulative character
+    advances are only used as a starting guess when splitting long words;
+    the final break is always confirmed against the real (kerned) width so
+    the result matches measuring every prefix with ImageDraw.textlength.
+    """
+
+    max_words = 8192
+
+    def __init__(self, font: ImageFont.FreeTypeFont):
+        self.font = font
+        self._chars = {}
+        self._words = {}
+
+    def measure(self, text: str) -> float:
+        """Uncached width of text, identical to ImageDraw.textlength on an RGB/L image"""
+        return self.font.getlength(text)
+
+    def advance(self, char: str) -> float:
+        """Advance width of a single character"""
+        width = self._chars.get(char)
+        if width is None:
+            width = self._chars[char] = self.measure(char)
+        return width
+
+    def width(self, text: str) -> float:
+        """Width of a word, memoized"""
+        width = self._words.get(text)
+        if width is None:
+            if len(self._words) >= self.max_words:
+                self._words.clear()
+            width = self._words[text] = self.measure(text)
+        return width
+
+    def split(self, word: str, limit: float) -> list:
+        """Split a word into pieces that each fit within limit"""
+        # Cumulative advances, computed once per word
+        offsets = [0, *accumulate(self.advance(c) for c in word)]
+        parts = []
+        start = 0
+        while start < len(word):
+            count = self._fit(word, start, offsets, limit)
+            parts.append(word[start:start + count])
+            start += count
+        return parts
+
+    def _fit(self, word: str, start: int, offsets: list, limit: float) -> int:
+        """Number of characters from word[start:] that fit within limit (at least one)"""
+        n = len(word) - start
+
+        def fits(k):
+            return self.measure(word[start:start + k]) <= limit
+
+        # Invariant: the first lo characters fit, the first hi don't (hi > n: unknown)
+        lo, hi = 0, n + 1
+
+        # Seed from summed advances; exact for fonts without kerning
+        guess = bisect_right(offsets, offsets[start] + limit, start) - 1 - start
+        for k in (guess, guess + 1):
+            if lo < k < hi and k <= n:
+                if fits(k):
+                    lo = k
+                else:
+                    hi = k
+
+        # Kerned fonts can miss the guess: gallop to bracket, then bisect
+        while hi > n:
+            if lo == n:
+                return n
+            k = min(n, max(lo * 2, lo + 1))
+            if fits(k):
+                lo = k
+            else:
+                hi = k
+
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if fits(mid):
+                lo = mid
+            else:
+                hi = mid
+
+        return max(lo, 1)
+
+
+class TextLayout:
+    """Greedy word wrapper for a fixed usable width"""
+
+    def __init__(self, font: ImageFont.FreeTypeFont, usable_width: int, glyphs: GlyphCache = None):
+        self.usable_width = usable_width
+        # Pass the LoadedFont's glyphs to reuse measurements across layouts
+        self.glyphs = glyphs or GlyphCache(font)
+
+    def split_long_word(self, word: str) -> list:
+        """Split a word that's too long to fit on one line"""
+        return self.glyphs.split(word, self.usable_width)
+
+    def wrap_paragraph(self, line: str) -> list:
+        """Wrap a single input line (no newlines) into output lines"""
+        if not line.strip():
+            return ['']
+
+        glyphs = self.glyphs
+        usable_width = self.usable_width
+        space_width = glyphs.advance(" ")
+
+        lines = []
+        current_line = []
+        current_width = 0
+
+        for word in line.split():
+            word_width = glyphs.width(word)
+
+            total_width = current_width
+            if current_line:
+                total_width += space_width
+            total_width += word_width
+
+            if total_width <= usable_width:
+                current_line.append(word)
+                current_width = total_width
+            else:
+                if current_line:
+                    lines.append(' '.join(current_line))
+                    current_line = []
+                    current_width = 0
+
+                if word_width > usable_width:
+                    word_parts = self.split_long_word(word)
+                    lines.extend(word_parts[:-1])
+                    if word_parts[-1]:
+                        current_line = [word_parts[-1]]
+                        current_width = glyphs.measure(word_parts[-1])
+                else:
+                    current_line = [word]
+                    current_width = word_width
+
+        if current_line:
+            lines.append(' '.join(current_line))
+
+        return lines
+
+    def wrap(self, text: str, progress_callback=None, check_cancelled=None) -> list:
+        """Wrap text into lines that fit the usable width
+
+        check_cancelled, if given, is called before each paragraph and may raise to abandon the layout.
+        """
+        lines = []
+        text_lines = text.split('\n')
+        total_lines = len(text_lines)
+
+        for i, line in enumerate(text_lines):
+            if check_cancelled:
+                check_cancelled()
+            if not line.strip():
+                lines.append('')
+                continue
+
+            lines.extend(self.wrap_paragraph(line))
+
+            if progress_callback and i % 10 == 0:
+                progress = int((i / total_lines) * 50)
+                progress_callback(f"Processing text... {progress}%")
+
+        return lines
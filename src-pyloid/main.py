@@ -6,12 +6,37 @@ from pyloid import (
     is_production,
     get_production_path,
 )
+import io
 import os
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 from PySide6.QtCore import QThread, Signal
-import uuid
+from PySide6.QtWidgets import QApplication
 from pathlib import Path
 
+from fonts import font_cache
+from imaging import DITHER_METHODS, MAX_PHOTO_PIXELS, encode_bmp, load_photo
+from ipp import DOCUMENT_FORMAT
+from preview import PreviewScheduler
+from preview_server import PreviewServer
+from print_queue import PrintQueue
+from printers import PrinterRegistry
+from printer_pools import PrinterPools, is_pool_url
+from printing import PrintError
+from render import encode_png
+from render_cache import RenderCache, decode_bmp
+from sticker import (
+    CANVAS_DPI,
+    PHOTO_DPI,
+    StickerRenderer,
+    canvas_cache_key,
+    find_font_path,
+    length_cm,
+    photo_cache_key,
+    render_canvas,
+    render_photo,
+)
+from tracing import tracer
+
 app = Pyloid(app_name="ASSNP", single_instance=True)
 
 if is_production():
@@ -43,314 +68,264 @@ app.set_tray_menu_items(
 
 def get_font_path():
     """Get the path to the font file, falling back to system fonts if needed"""
-    font_paths = [
-        "src-pyloid/assets/SpaceMono-Regular.ttf",  # Local development path
-    ]
-    
     # Only add production path if we're in production mode
     if is_production():
-        font_paths.append(os.path.join(get_production_path(), "assets/SpaceMono-Regular.ttf"))
-    
-    # System font fallbacks
-    font_paths.extend([
-        "/System/Library/Fonts/Helvetica.ttc",  # macOS fallback
-        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux fallback
-        "C:\\Windows\\Fonts\\arial.ttf",  # Windows fallback
-    ])
-    
-    for path in font_paths:
-        if os.path.exists(path):
-            return path
-    
-    raise OSError("No suitable font found. Please install Space Mono or ensure system fonts are available.")
-
-class PrinterThread(QThread):
+        return find_font_path([os.path.join(get_production_path(), "assets/SpaceMono-Regular.ttf")])
+    return find_font_path()
+
+class PrintWorker(QThread):
     progress = Signal(str)
     finished = Signal(str)
     error = Signal(str)
+    stats = Signal(dict)
 
-    def __init__(self, image_path, length_cm, printer_url):
+    def __init__(self, print_queue):
         super().__init__()
-        self.image_path = image_path
-        self.length_cm = length_cm
-        self.printer_url = printer_url
+        self.print_queue = print_queue
 
     def run(self):
-        try:
-            if not self.printer_url:
-                raise Exception("No printer selected")
+        # Long-lived: drains the persistent queue until the app quits
+        self.print_queue.run(self.progress.emit, self.finished.emit, self.error.emit, self.stats.emit)
 
-            self.progress.emit("Sending to printer...")
-            
-            # Clean up the printer URL - ensure it's in the correct format
-            printer_url = None
-            if "ipp://" in self.printer_url:
-                printer_url = self.printer_url
-            elif "dnssd://" in self.printer_url:
-                # Convert dnssd URL to IPP URL format
-                name = self.printer_url.split("(")[1].split(")")[0]
-                printer_url = f"ipp://{name}.local:631/ipp/print"
-            
-            if not printer_url:
-                raise Exception("Invalid printer URL")
-                
-            # Use the full IPP URL with the image path directly
-            os.system(f'ipptool -tv -f {self.image_path} "{printer_url}" -d fileType=image/reverse-encoding-bmp print-job.test')
-            
-            # Cleanup
-            try:
-                if os.path.exists(self.image_path):
-                    os.remove(self.image_path)
-            except:
-                pass
-            
-            self.finished.emit(f"Print job completed successfully ({self.length_cm:.1f}cm)")
-        except Exception as e:
-            self.error.emit(f"Error: {str(e)}")
-            # Cleanup on error
-            try:
-                if os.path.exists(self.image_path):
-                    os.remove(self.image_path)
-            except:
-                pass
+class PrinterDiscoveryWorker(QThread):
+    changed = Signal(list)
 
-class PreviewThread(QThread):
+    def __init__(self, printer_registry):
+        super().__init__()
+        self.printer_registry = printer_registry
+
+    def run(self):
+        # Long-lived: rediscovers printers on a TTL until the app quits
+        self.printer_registry.run(self.changed.emit)
+
+class PreviewWorker(QThread):
     progress = Signal(str)
-    finished = Signal(tuple)  # (preview_path, length_cm)
+    finished = Signal(tuple)  # (generation, image, png_bytes, length_cm, cached bmp, cache key)
     error = Signal(str)
 
-    def __init__(self, api_instance, text, width_inches, dpi, font_size, margin_cm):
+    def __init__(self, preview_scheduler):
         super().__init__()
-        self.api = api_instance
-        self.text = text
-        self.width_inches = width_inches
-        self.dpi = dpi
-        self.font_size = font_size
-        self.margin_cm = margin_cm
+        self.preview_scheduler = preview_scheduler
 
     def run(self):
-        try:
-            image, length_cm = self.api._generate_image(
-                self.text,
-                self.width_inches,
-                self.dpi,
-                self.font_size,
-                self.margin_cm,
-                self.progress.emit
-            )
-            
-            # Use a unique filename for each preview
-            preview_path = f"preview_{uuid.uuid4()}.png"
-            image.save(preview_path, optimize=True, quality=85)
-            
-            self.finished.emit((preview_path, length_cm))
-        except Exception as e:
-            self.error.emit(f"Error generating preview: {str(e)}")
+        # Long-lived: renders the newest preview request until the app quits
+        self.preview_scheduler.run(
+            lambda generation, result: self.finished.emit((generation, *result)),
+            lambda message: self.error.emit(f"Error generating preview: {message}"),
+            self.progress.emit,
+        )
 
 class TextPrinterAPI(PyloidAPI):
     def __init__(self):
         super().__init__()
-        self.current_preview = None
         self.current_image = None
         self.current_length = None
+        self.current_bmp = None
         self.current_printer = None
-
-    def split_long_word(self, word: str, usable_width: int, draw: ImageDraw, font: ImageFont) -> list:
-        """Split a word that's too long to fit on one line"""
-        parts = []
-        while word:
-            # Try to fit as many characters as possible
-            for i in range(len(word)):
-                part = word[:i+1]
-                if draw.textlength(part, font=font) > usable_width:
-                    # Found the breaking point, use previous length
-                    if i > 0:
-                        parts.append(word[:i])
-                        word = word[i:]
-                    else:
-                        # If even one character is too wide, force split it
-                        parts.append(word[0])
-                        word = word[1:]
-                    break
-            else:
-                # Remaining word fits entirely
-                parts.append(word)
-                word = ''
-        return parts
-
-    def _generate_image(self, text: str, width_inches: float, dpi: int, font_size: int, margin_cm: float = 0, progress_callback=None):
-        """Common image generation code for both preview and print"""
-        try:
-            # Calculate pixel dimensions
-            image_width_px = 576  # Fixed width for thermal printer
-            margin_px = int((margin_cm / 2.54) * dpi)  # Convert cm to inches to pixels
-            
-            # Scale font size with DPI
-            scaled_font_size = int(font_size * (dpi / 72))
-            font = ImageFont.truetype(get_font_path(), scaled_font_size)
-            
-            if progress_callback:
-                progress_callback("Processing text...")
-                
-            # Create a dummy image for dimension calculations
-            dummy_image = Image.new("RGB", (1, 1))
-            draw = ImageDraw.Draw(dummy_image)
-            
-            # Calculate line height and margins
-            line_height = draw.textbbox((0, 0), "A", font=font)[3]
-            side_margin_px = int(0.03 * dpi)  # Horizontal margin
-            usable_width = image_width_px - (2 * side_margin_px)
-            
-            # Process text in chunks
-            lines = []
-            text_lines = text.split('\n')
-            total_lines = len(text_lines)
-            
-            for i, line in enumerate(text_lines):
-                if not line.strip():
-                    lines.append('')
-                    continue
-                
-                words = line.split()
-                current_line = []
-                current_width = 0
-                
-                for word in words:
-                    word_width = draw.textlength(word, font=font)
-                    space_width = draw.textlength(" ", font=font)
-                    
-                    total_width = current_width
-                    if current_line:
-                        total_width += space_width
-                    total_width += word_width
-                    
-                    if total_width <= usable_width:
-                        current_line.append(word)
-                        current_width = total_width
-                    else:
-                        if current_line:
-                            lines.append(' '.join(current_line))
-                            current_line = []
-                            current_width = 0
-                        
-                        if word_width > usable_width:
-                            word_parts = self.split_long_word(word, usable_width, draw, font)
-                            lines.extend(word_parts[:-1])
-                            if word_parts[-1]:
-                                current_line = [word_parts[-1]]
-                                current_width = draw.textlength(word_parts[-1], font=font)
-                        else:
-                            current_line = [word]
-                            current_width = word_width
-                
-                if current_line:
-                    lines.append(' '.join(current_line))
-                
-                if progress_callback and i % 10 == 0:
-                    progress = int((i / total_lines) * 50)
-                    progress_callback(f"Processing text... {progress}%")
-            
-            if progress_callback:
-                progress_callback("Creating image...")
-            
-            # Calculate dimensions with margins
-            base_margin = int(0.05 * dpi)  # Default minimal margin
-            top_margin = margin_px + base_margin  # Add user margin to base margin
-            bottom_margin = margin_px + base_margin
-            image_height_px = (line_height * len(lines)) + top_margin + bottom_margin
-            
-            # Create the final image
-            image = Image.new("RGB", (image_width_px, image_height_px), "white")
-            draw = ImageDraw.Draw(image)
-            
-            # Draw text with margins
-            y = top_margin  # Start from top margin
-            total_lines = len(lines)
-            
-            for i, line in enumerate(lines):
-                draw.text((side_margin_px, y), line, fill="black", font=font)
-                y += line_height
-                
-                if progress_callback and i % 10 == 0:
-                    progress = 50 + int((i / total_lines) * 50)
-                    progress_callback(f"Drawing text... {progress}%")
-            
-            # Calculate actual length including margins
-            length_inches = image_height_px / dpi
-            length_cm = length_inches * 2.54
-            
-            return image, length_cm
-        except Exception as e:
-            import traceback
-            print(f"Error in _generate_image: {str(e)}")
-            print(traceback.format_exc())
-            raise
+        self.dither_method = "floyd-steinberg"
+        self.max_photo_pixels = MAX_PHOTO_PIXELS
+        
+        # Pools spread the jobs sent to a pool:// URL over several printers
+        self.printer_pools = PrinterPools()
+        
+        # Print jobs go through a persistent queue drained by one worker,
+        # started once the window exists so recovered jobs can report progress.
+        # Long texts are queued as render requests and streamed band by band when printed
+        self.print_queue = PrintQueue(self.printer_pools.submit, max_workers=16, render=self._render_deferred)
+        self.print_worker = None
+        for pool in self.printer_pools.stats():
+            # Each printer of a pool prints one job at a time
+            self.print_queue.set_printer_limit(pool["url"], len(pool["printers"]))
+        
+        # Printers are discovered in the background and served from a cache
+        self.printer_registry = PrinterRegistry()
+        self.printer_discovery = None
+        
+        self.renderer = StickerRenderer(get_font_path())
+        
+        # Previews are debounced and rendered one at a time, newest request wins
+        self.preview_scheduler = PreviewScheduler(self._render_preview)
+        self.preview_worker = None
+        
+        # Preview images travel over a loopback HTTP endpoint instead of the bridge
+        self.preview_server = PreviewServer().start()
+        
+        # Very tall previews are laid out once and drawn tile by tile as the user scrolls
+        self.tiled_preview = None
+        self.tiled_preview_request = None
+        self.tiled_preview_id = 0
+        
+        # Printed bitmaps are cached on disk by a hash of their inputs, so reprints skip rendering
+        self.render_cache = RenderCache()
+        self.current_cache_key = None
+
+    def shutdown(self):
+        """Stop the long-lived workers and wait for them, so none is still running when Qt exits"""
+        self.preview_scheduler.stop()
+        self.printer_registry.stop()
+        self.print_queue.stop()  # Jobs being printed are finished first
+        for worker in (self.preview_worker, self.printer_discovery, self.print_worker):
+            if worker is not None:
+                worker.wait()
+        
+        self.print_queue.close()
+        self.preview_server.stop()
+        tracer.export_to(None)
 
     @Bridge(str, float, int, int, float, result=str)
     def preview_text(self, text: str, width_inches: float, dpi: int, font_size: int, margin_cm: float):
-        # Create and start the preview thread
-        self.preview_thread = PreviewThread(self, text, width_inches, dpi, font_size, margin_cm)
-        self.preview_thread.progress.connect(self.on_progress)
-        self.preview_thread.finished.connect(self.on_preview_finished)
-        self.preview_thread.error.connect(self.on_error)
-        self.preview_thread.start()
+        # Supersedes any preview still pending or rendering
+        if self.preview_worker is None:
+            self.preview_worker = PreviewWorker(self.preview_scheduler)
+            self.preview_worker.progress.connect(self.on_progress)
+            self.preview_worker.finished.connect(self.on_preview_finished)
+            self.preview_worker.error.connect(self.on_error)
+            self.preview_worker.start()
+        self.preview_scheduler.submit((text, dpi, font_size, margin_cm))
         return "Generating preview..."
 
+    def _render_preview(self, request: tuple, progress_callback, check_cancelled) -> tuple:
+        text, dpi, font_size, margin_cm = request
+        with tracer.span("preview", chars=len(text)) as span:
+            key = self.renderer.cache_key(text, dpi, font_size, margin_cm)
+            
+            with tracer.span("preview.cache_lookup"):
+                bmp = self.render_cache.get(key)
+            span["cached"] = bmp is not None
+            if bmp is not None:
+                # Printed before with the same settings, only the preview PNG is needed
+                image = decode_bmp(bmp)
+                with tracer.span("preview.encode_png"):
+                    png_bytes = encode_png(image)
+                return image, png_bytes, length_cm(image, dpi), bmp, key
+            
+            with tracer.span("render.text"):
+                image, length = self.renderer.render_text(
+                    text, dpi, font_size, margin_cm, progress_callback,
+                    incremental=True, check_cancelled=check_cancelled
+                )
+            
+            # Encode once in memory; the image itself is kept for printing
+            check_cancelled()
+            with tracer.span("preview.encode_png"):
+                png_bytes = encode_png(image)
+            return image, png_bytes, length, None, key
+
+    @Bridge(str, float, int, int, float, result=dict)
+    def open_tiled_preview(self, text: str, width_inches: float, dpi: int, font_size: int, margin_cm: float):
+        """Lay out text for a tiled preview and return its size; tiles come from get_preview_tile"""
+        self.preview_scheduler.cancel()  # Don't let a pending full preview replace it
+        try:
+            self.tiled_preview = self.renderer.tiled(text, dpi, font_size, margin_cm)
+        except Exception as e:
+            self.tiled_preview = None
+            return {"error": str(e)}
+        
+        self.tiled_preview_id += 1
+        self.tiled_preview_request = (text, dpi, font_size, margin_cm)
+        self.current_image = None
+        self.current_bmp = None
+        self.current_cache_key = None
+        self.current_length = self.tiled_preview.length_cm
+        
+        return {
+            "id": self.tiled_preview_id,
+            "width": self.tiled_preview.width,
+            "height": self.tiled_preview.height,
+            "tile_height": self.tiled_preview.tile_height,
+            "tiles": self.tiled_preview.tile_count,
+            "length": f"{self.tiled_preview.length_cm:.1f}",
+        }
+
+    @Bridge(int, int, result=str)
+    def get_preview_tile(self, preview_id: int, index: int):
+        """URL of one tile of the current tiled preview, or an empty string if it's gone"""
+        tiled_preview = self.tiled_preview
+        if tiled_preview is None or preview_id != self.tiled_preview_id:
+            return ""
+        try:
+            return self.preview_server.publish(tiled_preview.tile_png(index))
+        except IndexError:
+            return ""
+
     @Bridge(tuple, result=None)
     def on_preview_finished(self, result: tuple):
-        preview_path, length_cm = result  # The preview thread already saved the image
+        # Rendered and encoded by the preview worker
+        generation, image, png_bytes, length_cm, bmp, key = result
+        if not self.preview_scheduler.is_current(generation):
+            return  # A newer preview was requested after this one finished
         try:
-            # Load and encode the preview data
-            with open(preview_path, 'rb') as image_file:
-                import base64
-                encoded_string = base64.b64encode(image_file.read()).decode()
-                
-                # Clean up old preview if it exists
-                if self.current_preview and self.current_preview != preview_path:
-                    try:
-                        os.remove(self.current_preview)
-                    except:
-                        pass
-                
-                # Store current preview path and data
-                self.current_preview = preview_path
-                self.current_image = Image.open(preview_path)  # Load the image for later printing
-                self.current_length = length_cm
-                
-                # Send preview data to frontend
+            # Keep the rendered image in memory for printing
+            self.tiled_preview = None
+            self.current_bmp = bmp
+            self.current_cache_key = key
+            self.current_image = image
+            self.current_length = length_cm
+            
+            # Send only the preview's URL to frontend, the PNG is served over loopback
+            with tracer.span("preview.publish", bytes=len(png_bytes)):
                 self.window.emit('preview_ready', {
-                    "preview": f"data:image/png;base64,{encoded_string}",
+                    "preview": self.preview_server.publish(png_bytes),
                     "length": f"{length_cm:.1f}"
                 })
+            self.window.emit('stage_timings', tracer.percentiles())
         except Exception as e:
             self.window.emit('print_error', {"message": f"Error loading preview: {str(e)}"})
-            if preview_path:
-                try:
-                    os.remove(preview_path)
-                except:
-                    pass
 
     @Bridge(result=str)
     def print_current(self):
         """Print the currently previewed image"""
+        if self.current_image is None and self.tiled_preview is not None:
+            # Tiled previews are never rendered in full, stream them to the printer instead
+            text, dpi, font_size, margin_cm = self.tiled_preview_request
+            return self._enqueue_streaming(text, dpi, font_size, margin_cm, self.tiled_preview.length_cm)
+        
         if not self.current_image:
             return "Error: No preview available"
         
-        if hasattr(self, 'current_bmp_path') and os.path.exists(self.current_bmp_path):
-            # For images, use the BMP file directly
-            temp_path = self.current_bmp_path
+        if not self.current_printer:
+            return "Error: No printer selected"
+        
+        if self.current_bmp:
+            # For images, use the prepared BMP
+            data = self.current_bmp
         else:
-            # For text/markdown, use the current image
-            temp_path = f"temp_output_{uuid.uuid4()}.png"
-            self.current_image.save(temp_path)
-            
-        # Create and start the printer thread with the file path
-        self.printer_thread = PrinterThread(temp_path, self.current_length, self.current_printer)
-        self.printer_thread.progress.connect(self.on_progress)
-        self.printer_thread.finished.connect(self.on_finished)
-        self.printer_thread.error.connect(self.on_error)
-        self.printer_thread.start()
-        return "Print job started..."
+            # For text/markdown, encode the current image the same way
+            with tracer.span("print.encode_bmp", height=self.current_image.height):
+                data = encode_bmp(self.current_image)
+        
+        if self.current_cache_key:
+            self.render_cache.put(self.current_cache_key, data)
+        
+        job_id = self.print_queue.enqueue(self.current_printer, data, DOCUMENT_FORMAT, self.current_length)
+        self._start_print_worker()
+        return f"Print job {job_id} queued..."
+
+    def _enqueue_streaming(self, text: str, dpi: int, font_size: int, margin_cm: float, length_cm: float):
+        """Queue text to be rendered band by band while it is sent, for documents too long to render in one piece"""
+        if not self.current_printer:
+            return "Error: No printer selected"
+        
+        request = {"text": text, "dpi": dpi, "font_size": font_size, "margin_cm": margin_cm}
+        job_id = self.print_queue.enqueue_deferred(self.current_printer, request, DOCUMENT_FORMAT, length_cm)
+        self._start_print_worker()
+        return f"Print job {job_id} queued..."
+
+    def _render_deferred(self, request: dict, progress_callback):
+        """Document of a queued streaming job, rendered band by band as it is sent"""
+        document, _ = self.renderer.stream_document(
+            request["text"], request["dpi"], request["font_size"], request["margin_cm"], progress_callback
+        )
+        return document
+
+    def _start_print_worker(self):
+        if self.print_worker is None:
+            self.print_worker = PrintWorker(self.print_queue)
+            self.print_worker.progress.connect(self.on_progress)
+            self.print_worker.finished.connect(self.on_finished)
+            self.print_worker.error.connect(self.on_error)
+            self.print_worker.stats.connect(self.on_queue_stats)
+            self.print_worker.start()
 
     @Bridge(str, result=None)
     def on_progress(self, message: str):
@@ -367,6 +342,16 @@ class TextPrinterAPI(PyloidAPI):
         # Send error message to frontend
         self.window.emit('print_error', {"message": message})
 
+    @Bridge(dict, result=None)
+    def on_queue_stats(self, stats: dict):
+        # Send queue depth and throughput to frontend
+        self.window.emit('print_queue_stats', stats)
+
+    @Bridge(result=dict)
+    def get_queue_stats(self):
+        """Get print queue depth and throughput"""
+        return self.print_queue.stats()
+
     @Bridge(result=str)
     def get_printer_status(self):
         # You could implement printer status checking here
@@ -374,74 +359,172 @@ class TextPrinterAPI(PyloidAPI):
 
     @Bridge(result=list)
     def get_printers(self):
-        """Get list of available IPP printers"""
-        try:
-            printers = []
-            
-            # Use lpstat to list all printers
-            import subprocess
-            result = subprocess.run(['lpstat', '-v'], capture_output=True, text=True)
-            
-            for line in result.stdout.split('\n'):
-                if ':' in line:  # Any printer entry
-                    try:
-                        # Extract printer name and URL/device
-                        parts = line.split(':', 1)
-                        name = parts[0].split()[-1]  # Get last word before colon
-                        url = parts[1].strip()
-                        printers.append({
-                            "name": f"{name} ({url})",
-                            "url": url
-                        })
-                    except:
-                        continue
-            
-            return printers
-        except Exception as e:
-            print(f"Error getting printers: {str(e)}")
-            return []
+        """Get the last known printers; changes arrive later as printers_changed events"""
+        # The frontend asks for printers on load, resume any queued jobs from a previous run
+        self._start_print_worker()
+        self._start_printer_discovery()
+        return self.printer_registry.printers() + self.printer_pools.printers()
+
+    @Bridge(result=None)
+    def refresh_printers(self):
+        """Rediscover printers in the background"""
+        self._start_printer_discovery()
+        self.printer_registry.refresh()
+
+    def _start_printer_discovery(self):
+        if self.printer_discovery is None:
+            self.printer_discovery = PrinterDiscoveryWorker(self.printer_registry)
+            self.printer_discovery.changed.connect(self.on_printers_changed)
+            self.printer_discovery.start()
+
+    @Bridge(list, result=None)
+    def on_printers_changed(self, printers: list):
+        # Send the updated printer list to frontend
+        self.window.emit('printers_changed', {"printers": printers + self.printer_pools.printers()})
+
+    @Bridge(str, list, str, result=str)
+    def create_printer_pool(self, name: str, printer_urls: list, strategy: str):
+        """Create or redefine a pool of printers that share its jobs; returns its pool:// URL"""
+        printers = []
+        for printer_url in printer_urls:
+            try:
+                printers.append(self.printer_registry.resolve(printer_url))
+            except PrintError:
+                printers.append(printer_url)  # Reported, and ejected, when printing
+        pool = self.printer_pools.create(name, printers, strategy or "least-loaded")
+        self.print_queue.set_printer_limit(pool.url, len(pool.printers))
+        self.on_printers_changed(self.printer_registry.printers())
+        return pool.url
+
+    @Bridge(str, result=None)
+    def remove_printer_pool(self, name: str):
+        """Delete a printer pool"""
+        self.printer_pools.remove(name)
+        self.on_printers_changed(self.printer_registry.printers())
+
+    @Bridge(result=list)
+    def get_printer_pools(self):
+        """Get every pool with the health, load and latency of its printers"""
+        return self.printer_pools.stats()
+
+    @Bridge(result=dict)
+    def get_font_cache_stats(self):
+        """Get font cache hit/miss counters"""
+        return font_cache.stats()
+
+    @Bridge(result=None)
+    def clear_font_cache(self):
+        """Drop all cached fonts and re-resolve the font path"""
+        self.renderer.clear()
+        self.renderer.font_path = get_font_path()
+
+    @Bridge(result=dict)
+    def get_stage_timings(self):
+        """Get rolling p50/p90/p99 timings of every preview and print stage"""
+        return tracer.percentiles()
+
+    @Bridge(result=None)
+    def reset_stage_timings(self):
+        """Forget the timings collected so far"""
+        tracer.reset()
+
+    @Bridge(str, result=None)
+    def set_trace_export(self, path: str):
+        """Append every timing span to a JSON-lines file; an empty path stops exporting"""
+        tracer.export_to(path or None)
+
+    @Bridge(result=dict)
+    def get_render_cache_stats(self):
+        """Get render cache hit rate and size"""
+        return self.render_cache.stats()
+
+    @Bridge(result=None)
+    def clear_render_cache(self):
+        """Delete all cached printer bitmaps"""
+        self.render_cache.clear()
 
     @Bridge(str, result=None)
     def set_printer(self, printer_url: str):
-        """Set the current printer"""
-        self.current_printer = printer_url
+        """Set the current printer or printer pool"""
+        if is_pool_url(printer_url):
+            self.current_printer = printer_url
+            return
+        try:
+            self.current_printer = self.printer_registry.resolve(printer_url)
+        except PrintError:
+            self.current_printer = printer_url  # Reported when printing
+
+    @Bridge(result=str)
+    def get_preview_upload_url(self):
+        """URL the frontend POSTs rendered canvases to, answering with their preview ID"""
+        return self.preview_server.base_url
+
+    @Bridge(str, result=str)
+    def store_canvas_preview(self, preview_id: str):
+        """Store a canvas uploaded to the preview endpoint for printing"""
+        self.preview_scheduler.cancel()  # Don't let a pending text preview replace it
+        item = self.preview_server.store.get(preview_id)
+        if item is None:
+            return "Error: Canvas not found"
+        
+        try:
+            self._store_canvas_png(item[0])
+            return "Canvas stored"
+        except Exception as e:
+            print(f"Error storing canvas data: {str(e)}")
+            return f"Error storing canvas: {str(e)}"
 
     @Bridge(str, result=None)
     def store_canvas_data(self, canvas_data: str):
         """Store canvas data for printing"""
+        self.preview_scheduler.cancel()  # Don't let a pending text preview replace it
         try:
             # Remove the data URL prefix
             image_data = canvas_data.split(',')[1]
             
             import base64
-            import io
-            from PIL import Image
             
             # Load and convert image
             image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Ensure exact 576px width
-            if image.width != 576:
-                height = int((576 / image.width) * image.height)
-                image = image.resize((576, height), Image.Resampling.LANCZOS)
-            
-            # Set the DPI metadata to match the printer's requirements
-            image.info['dpi'] = (203, 203)  # ASSNP uses 203 DPI (8 dots/mm)
-            
-            # Convert to monochrome (1-bit)
-            image = image.convert('1')
-            
-            # Store for printing
-            self.current_image = image
-            self.current_length = (image.height / 203) * 2.54  # Use 203 DPI for length calculation
+            self._store_canvas_png(image_bytes)
             
         except Exception as e:
             print(f"Error storing canvas data: {str(e)}")
 
+    def _store_canvas_png(self, png_bytes: bytes):
+        key = canvas_cache_key(png_bytes)
+        bmp = self.render_cache.get(key)
+        if bmp is not None:
+            image = decode_bmp(bmp)
+        else:
+            with Image.open(io.BytesIO(png_bytes)) as canvas:
+                image = render_canvas(canvas)
+        
+        # Store for printing
+        self.tiled_preview = None
+        self.current_image = image
+        self.current_bmp = bmp
+        self.current_cache_key = key
+        self.current_length = length_cm(image, CANVAS_DPI)
+
+    @Bridge(str, result=None)
+    def set_dither_method(self, method: str):
+        """Set the dithering used when preparing image files"""
+        if method not in DITHER_METHODS:
+            raise ValueError(f"Unknown dither method: {method}")
+        self.dither_method = method
+
+    @Bridge(float, result=None)
+    def set_max_photo_megapixels(self, megapixels: float):
+        """Set the largest photo (after reduced decoding) prepare_image_file accepts"""
+        if megapixels <= 0:
+            raise ValueError("The pixel budget must be positive")
+        self.max_photo_pixels = int(megapixels * 1_000_000)
+
     @Bridge(str, result=str)
     def prepare_image_file(self, file_path: str):
         """Prepare an image file for printing"""
+        self.preview_scheduler.cancel()  # Don't let a pending text preview replace it
         try:
             # Validate file exists
             if not os.path.exists(file_path):
@@ -449,89 +532,58 @@ class TextPrinterAPI(PyloidAPI):
             
             self.window.emit('preview_progress', {"message": "Converting to printer format..."})
             
-            # Generate unique temp filenames
-            temp_output = f"temp_output_{uuid.uuid4()}.png"
-            output_bmp = f"output_{uuid.uuid4()}.bmp"
-            
-            # First resize to a narrower width (e.g., 500px) and save temporarily
-            image = Image.open(file_path)
-            target_width = 500  # Wider than before (was 400)
-            height = int((target_width / image.width) * image.height)
-            resized = image.resize((target_width, height), Image.Resampling.LANCZOS)
-            
-            # Create a new white image of exactly 576px width
-            final_image = Image.new('RGB', (576, height), 'white')
-            
-            # Paste the resized image in the center (less padding)
-            paste_x = (576 - target_width) // 2
-            final_image.paste(resized, (paste_x, 0))
+            with tracer.span("photo.read"):
+                with open(file_path, "rb") as f:
+                    file_bytes = f.read()
+            key = photo_cache_key(file_bytes, self.dither_method)
             
-            final_image.save(temp_output)
-            
-            # Save a preview PNG (un-flipped version for display)
-            preview_path = f"preview_{uuid.uuid4()}.png"
-            
-            # For preview, use the original processed image before flipping
-            os.system(f'magick {temp_output} -modulate 120,100,100 -monochrome -colors 2 {preview_path}')
-            
-            # For printing, create the flipped BMP
-            os.system(f'magick {temp_output} -modulate 120,100,100 -monochrome -colors 2 -flip BMP3:{output_bmp}')
-            
-            # Store both the BMP and its path for printing
-            self.current_image = Image.open(output_bmp)
-            self.current_bmp_path = output_bmp
-            self.current_length = (self.current_image.height / 203) * 2.54
-            
-            # Clean up temp PNG
-            try:
-                os.remove(temp_output)
-            except:
-                pass
-            
-            # Clean up old preview
-            if self.current_preview and self.current_preview != preview_path:
-                try:
-                    os.remove(self.current_preview)
-                except:
-                    pass
-            
-            self.current_preview = preview_path
+            bmp = self.render_cache.get(key)
+            if bmp is not None:
+                bilevel = decode_bmp(bmp)
+                length = length_cm(bilevel, PHOTO_DPI)
+            else:
+                # Decode once, reduced, and derive both the preview and the (flipped) print BMP from it
+                with tracer.span("photo.load", bytes=len(file_bytes)):
+                    image = load_photo(io.BytesIO(file_bytes), max_pixels=self.max_photo_pixels)
+                bilevel, length = render_photo(image, self.dither_method)
+                with tracer.span("photo.encode_bmp"):
+                    bmp = encode_bmp(bilevel)
+            
+            self.tiled_preview = None
+            self.current_image = bilevel
+            self.current_bmp = bmp
+            self.current_cache_key = key
+            self.current_length = length
             
             # Send preview to frontend
-            with open(preview_path, 'rb') as image_file:
-                import base64
-                encoded_string = base64.b64encode(image_file.read()).decode()
-                
-                self.window.emit('preview_ready', {
-                    "preview": f"data:image/png;base64,{encoded_string}",
-                    "length": f"{self.current_length:.1f}"
-                })
+            with tracer.span("photo.encode_png"):
+                png_bytes = encode_png(bilevel)
+            self.window.emit('preview_ready', {
+                "preview": self.preview_server.publish(png_bytes),
+                "length": f"{self.current_length:.1f}"
+            })
+            self.window.emit('stage_timings', tracer.percentiles())
             
             return f"Image prepared successfully ({self.current_length:.1f}cm)"
             
         except Exception as e:
             return f"Error preparing image: {str(e)}"
 
-    def __del__(self):
-        # Clean up any remaining preview file
-        if self.current_preview:
-            try:
-                os.remove(self.current_preview)
-            except:
-                pass
-
 ####################################################################
 
+api = TextPrinterAPI()
+QApplication.instance().aboutToQuit.connect(api.shutdown)
+
 if is_production():
     window = app.create_window(
         title="ASSNP",
-        js_apis=[TextPrinterAPI()],
+        js_apis=[api],
     )
     window.load_file(os.path.join(get_production_path(), "build/index.html"))
 else:
     window = app.create_window(
         title="ASSNP",
-        js_apis=[TextPrinterAPI()],
+        js_apis=[api],
         dev_tools=True,
     )
     window.load_url("http://localhost:5173")
@@ -0,0 +1,160 @@
+"""One-shot multicast DNS browsing for IPP printers on the local network"""
+import socket
+import struct
+import time
+
+MDNS_ADDRESS = ("224.0.0.251", 5353)
+IPP_SERVICE = "_ipp._tcp.local"
+
+# Record types
+A = 1
+PTR = 12
+TXT = 16
+SRV = 33
+
+
+def _encode_name(name: str) -> bytes:
+    data = bytearray()
+    for label in name.rstrip(".").split("."):
+        encoded = label.encode("utf-8")
+        data.append(len(encoded))
+        data += encoded
+    return bytes(data) + b"\x00"
+
+
+def encode_query(questions: list, query_id: int = 0) -> bytes:
+    """DNS query for [(name, record type)]"""
+    message = bytearray(struct.pack(">HHHHHH", query_id, 0, len(questions), 0, 0, 0))
+    for name, record_type in questions:
+        message += _encode_name(name) + struct.pack(">HH", record_type, 1)
+    return bytes(message)
+
+
+def _decode_name(message: bytes, offset: int) -> tuple:
+    """(name, offset after the name), following compression pointers"""
+    labels = []
+    end = None
+    for _ in range(128):  # Guard against pointer loops
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(message[offset:offset + length].decode("utf-8", "replace"))
+        offset += length
+    return ".".join(labels), end if end is not None else offset
+
+
+def decode_records(message: bytes) -> list:
+    """All answer, authority and additional records of a DNS message as (name, type, value)"""
+    _, _, questions, answers, authorities, additionals = struct.unpack_from(">HHHHHH", message, 0)
+    offset = 12
+    for _ in range(questions):
+        _, offset = _decode_name(message, offset)
+        offset += 4
+
+    records = []
+    for _ in range(answers + authorities + additionals):
+        name, offset = _decode_name(message, offset)
+        record_type, _, _, length = struct.unpack_from(">HHIH", message, offset)
+        offset += 10
+        start = offset
+        offset += length
+
+        if record_type == PTR:
+            value = _decode_name(message, start)[0]
+        elif record_type == SRV:
+            _, _, port = struct.unpack_from(">HHH", message, start)
+            value = (_decode_name(message, start + 6)[0], port)
+        elif record_type == TXT:
+            value = {}
+            position = start
+            while position < offset:
+                entry = message[position + 1:position + 1 + message[position]].decode("utf-8", "replace")
+                position += 1 + message[position]
+                key, _, entry_value = entry.partition("=")
+                if key:
+                    value[key.lower()] = entry_value
+        elif record_type == A and length == 4:
+            value = socket.inet_ntoa(message[start:offset])
+        else:
+            continue
+        records.append((name.lower(), record_type, value))
+    return records
+
+
+def query(questions: list, timeout: float = 1.5) -> list:
+    """Send a legacy unicast mDNS query and collect every record answered within the timeout"""
+    records = []
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
+        sock.sendto(encode_query(questions), MDNS_ADDRESS)
+
+        # Responders answer a query from a random port directly to that port
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                message, _ = sock.recvfrom(9000)
+            except socket.timeout:
+                break
+            try:
+                records.extend(decode_records(message))
+            except (struct.error, IndexError):
+                continue  # Ignore malformed packets
+    finally:
+        sock.close()
+    return records
+
+
+def browse(service: str = IPP_SERVICE, timeout: float = 1.5) -> list:
+    """Find instances of a service and resolve them to host, port and TXT data.
+
+    Returns [{"instance", "name", "host", "address", "port", "txt"}]. Most
+    printers include SRV, TXT and A records with the PTR answer, anything
+    missing is asked for in a second round.
+    """
+    records = query([(service, PTR)], timeout)
+    instances = {value for name, record_type, value in records
+                 if record_type == PTR and name == service.lower()}
+    if not instances:
+        return []
+
+    def index(records):
+        table = {}
+        for name, record_type, value in records:
+            table.setdefault((name, record_type), value)
+        return table
+
+    table = index(records)
+    missing = [(instance, record_type) for instance in instances for record_type in (SRV, TXT)
+               if (instance.lower(), record_type) not in table]
+    missing += [(table[instance.lower(), SRV][0], A) for instance in instances
+                if (instance.lower(), SRV) in table and (table[instance.lower(), SRV][0].lower(), A) not in table]
+    if missing:
+        records += query(missing, timeout)
+        table = index(records)
+
+    found = []
+    for instance in sorted(instances):
+        srv = table.get((instance.lower(), SRV))
+        if srv is None:
+            continue
+        host, port = srv
+        found.append({
+            "instance": instance,
+            "name": instance[:-len(service) - 1] if instance.lower().endswith("." + service.lower()) else instance,
+            "host": host,
+            "address": table.get((host.lower(), A)),
+            "port": port,
+            "txt": table.get((instance.lower(), TXT), {}),
+        })
+    return found
@@ -0,0 +1,7 @@
+"""Where the app keeps its state between runs"""
+import os
+
+
+def data_path(*parts: str) -> str:
+    """A location in the app's data directory, ~/.assnp"""
+    return os.path.join(os.path.expanduser("~"), ".assnp", *parts)
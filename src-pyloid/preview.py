@@ -0,0 +1,103 @@
+"""Debounced preview rendering with at most one render in flight"""
+import threading
+import time
+
+
+class PreviewCancelled(Exception):
+    """A newer preview request superseded the one being rendered"""
+
+
+class PreviewScheduler:
+    """Coalesces preview requests and renders only the newest one.
+
+    Every submit() gets a generation number. The worker waits until no
+    new request has arrived for `debounce` seconds, then renders the
+    latest one. If another request comes in meanwhile, the render is
+    abandoned at its next cancellation check and the worker moves on to
+    the newer request, so renders never overlap and results from older
+    generations are never delivered.
+    """
+
+    def __init__(self, render, debounce: float = 0.15):
+        self.render = render  # render(request, progress_callback, check_cancelled) -> result
+        self.debounce = debounce
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._generation = 0
+        self._request = None
+        self._requested_at = 0.0
+        self._stopping = False
+
+    @property
+    def generation(self) -> int:
+        """Generation number of the newest request"""
+        return self._generation
+
+    def is_current(self, generation: int) -> bool:
+        return generation == self._generation
+
+    def submit(self, request) -> int:
+        """Schedule a preview, superseding any pending or running one"""
+        with self._wakeup:
+            self._generation += 1
+            self._request = request
+            self._requested_at = time.monotonic()
+            self._wakeup.notify()
+            return self._generation
+
+    def cancel(self):
+        """Drop the pending request and abandon the running render"""
+        with self._wakeup:
+            self._generation += 1
+            self._request = None
+
+    def stop(self):
+        with self._wakeup:
+            self._stopping = True
+            self._generation += 1
+            self._wakeup.notify()
+
+    def _next(self):
+        """Wait for a request that has settled, returning (generation, request) or None when stopping"""
+        with self._wakeup:
+            while not self._stopping:
+                if self._request is None:
+                    self._wakeup.wait()
+                    continue
+                remaining = self._requested_at + self.debounce - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+                request, self._request = self._request, None
+                return self._generation, request
+            return None
+
+    def run(self, on_result, on_error, on_progress=None):
+        """Render requests until stop(), calling on_result(generation, result) for current ones only"""
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            generation, request = job
+
+            def check_cancelled():
+                if generation != self._generation:
+                    raise PreviewCancelled()
+
+            def progress(message):
+                check_cancelled()
+                if on_progress:
+                    on_progress(message)
+
+            try:
+                result = self.render(request, progress, check_cancelled)
+            except PreviewCancelled:
+                continue
+            except Exception as e:
+                if self.is_current(generation):
+                    on_error(str(e))
+                continue
+
+            if self.is_current(generation):
+                on_result(generation, result)
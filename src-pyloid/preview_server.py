@@ -0,0 +1,147 @@
+"""Loopback HTTP endpoint that serves rendered previews to the window by ID.
+
+Previews are kept in memory and addressed by a hash of their bytes, so
+the bridge only passes a short URL and the webview can cache each image
+forever. The markdown canvas travels the other way: the frontend POSTs
+the PNG and hands the returned ID to the bridge.
+
+Every URL starts with a random token, so other local processes and
+web pages can't read or inject previews.
+"""
+from collections import OrderedDict
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import secrets
+import threading
+
+MAX_UPLOAD_BYTES = 256 * 1024 * 1024
+
+
+class PreviewStore:
+    """Recent previews by content ID, oldest dropped first"""
+
+    def __init__(self, max_items: int = 64):
+        self.max_items = max_items
+        self._items = OrderedDict()  # id -> (data, content type)
+        self._lock = threading.Lock()
+
+    def put(self, data: bytes, content_type: str = "image/png") -> str:
+        """Store a preview and return its ID"""
+        preview_id = hashlib.blake2b(data, digest_size=12).hexdigest()
+        with self._lock:
+            self._items[preview_id] = (data, content_type)
+            self._items.move_to_end(preview_id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return preview_id
+
+    def get(self, preview_id: str):
+        """(data, content type) of a stored preview, or None"""
+        with self._lock:
+            item = self._items.get(preview_id)
+            if item is not None:
+                self._items.move_to_end(preview_id)
+            return item
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _preview_id(self):
+        """ID from /<token>/previews/<id>[.png], "" for the upload URL, None if the path doesn't match"""
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) < 2 or not secrets.compare_digest(parts[0], self.server.token) or parts[1] != "previews":
+            return None
+        if len(parts) == 2:
+            return ""
+        if len(parts) == 3:
+            return parts[2].split(".")[0]
+        return None
+
+    def _send(self, status: int, body: bytes = b"", headers: dict = None):
+        self.send_response(status)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_OPTIONS(self):
+        self._send(204, headers={
+            "Access-Control-Allow-Methods": "GET, POST",
+            "Access-Control-Allow-Headers": "Content-Type",
+        })
+
+    def do_GET(self):
+        preview_id = self._preview_id()
+        item = self.server.store.get(preview_id) if preview_id else None
+        if item is None:
+            self._send(404)
+            return
+
+        data, content_type = item
+        etag = f'"{preview_id}"'
+        headers = {
+            "ETag": etag,
+            # The ID is derived from the content, so a URL never changes meaning
+            "Cache-Control": "private, max-age=31536000, immutable",
+        }
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, headers=headers)
+            return
+        headers["Content-Type"] = content_type
+        self._send(200, data, headers)
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        if self._preview_id() != "":
+            self._send(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            self._send(413)
+            return
+
+        data = self.rfile.read(length)
+        preview_id = self.server.store.put(data, self.headers.get("Content-Type", "image/png"))
+        self._send(201, json.dumps({"id": preview_id}).encode(), {"Content-Type": "application/json"})
+
+
+class PreviewServer(ThreadingHTTPServer):
+    """Serves a PreviewStore on 127.0.0.1 from a background thread"""
+
+    daemon_threads = True
+
+    def __init__(self, store: PreviewStore = None, port: int = 0):
+        super().__init__(("127.0.0.1", port), PreviewRequestHandler)
+        self.store = store or PreviewStore()
+        self.token = secrets.token_urlsafe(16)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/{self.token}/previews"
+
+    def url(self, preview_id: str) -> str:
+        return f"{self.base_url}/{preview_id}.png"
+
+    def publish(self, data: bytes, content_type: str = "image/png") -> str:
+        """Store a preview and return the URL the window can load it from"""
+        return self.url(self.store.put(data, content_type))
+
+    def start(self) -> "PreviewServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
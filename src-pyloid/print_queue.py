@@ -0,0 +1,213 @@
+"""Durable print queue drained by a single long-lived worker"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from paths import data_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    printer_url TEXT NOT NULL,
+    document_format TEXT NOT NULL,
+    data BLOB,
+    request TEXT,
+    length_cm REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    error TEXT
+)
+"""
+
+
+class PrintQueue:
+    """SQLite-backed FIFO of print jobs with retries and per-printer limits.
+
+    Jobs survive crashes: anything still marked as printing when the queue
+    is opened again goes back to queued. run() dispatches jobs in order to
+    a small thread pool, never exceeding the concurrency limit of any one
+    printer, and retries failures with exponential backoff. A job waiting
+    for its retry doesn't hold up the jobs queued behind it.
+
+    Deferred jobs store a render request instead of a document; render()
+    turns it into the document each time the job is printed, so documents
+    too long to hold in memory can still be queued.
+    """
+
+    def __init__(self, submit, db_path: str = None, max_attempts: int = 5, backoff_seconds: float = 2.0,
+                 printer_limit: int = 1, max_workers: int = 4, render=None):
+        self.submit = submit  # submit(printer_url, data, document_format) -> job id, raises on failure
+        self.render = render  # render(request, progress_callback) -> document of a deferred job
+        self.db_path = db_path or data_path("print_queue.db")
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.printer_limit = printer_limit
+        self.printer_limits = {}  # Per-printer overrides of printer_limit
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopping = False
+        self._in_flight = {}  # printer_url -> number of jobs being printed
+        self._completed = deque(maxlen=1000)  # (finished_at, seconds) of recent jobs
+        self._completed_count = 0
+
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SCHEMA)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(jobs)")]
+        if "request" not in columns:
+            # Queues created before deferred jobs existed
+            self._db.execute("ALTER TABLE jobs ADD COLUMN request TEXT")
+
+        # Jobs interrupted by a crash are printed again
+        self._db.execute("UPDATE jobs SET status = 'queued' WHERE status = 'printing'")
+
+    def set_printer_limit(self, printer_url: str, limit: int):
+        """Limit how many jobs are sent to one printer at the same time"""
+        with self._wakeup:
+            self.printer_limits[printer_url] = max(1, limit)
+            self._wakeup.notify_all()
+
+    def enqueue(self, printer_url: str, data: bytes, document_format: str, length_cm: float) -> int:
+        """Add a job to the end of the queue and return its id"""
+        with self._wakeup:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (printer_url, document_format, data, length_cm, created_at) VALUES (?, ?, ?, ?, ?)",
+                (printer_url, document_format, data, length_cm, time.time()),
+            )
+            self._wakeup.notify_all()
+            return cursor.lastrowid
+
+    def enqueue_deferred(self, printer_url: str, request: dict, document_format: str, length_cm: float) -> int:
+        """Add a job that is rendered from a JSON-serializable request when it is printed"""
+        if self.render is None:
+            raise ValueError("This print queue has no renderer for deferred jobs")
+        with self._wakeup:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (printer_url, document_format, request, length_cm, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (printer_url, document_format, json.dumps(request), length_cm, time.time()),
+            )
+            self._wakeup.notify_all()
+            return cursor.lastrowid
+
+    def stats(self) -> dict:
+        """Queue depth and recent throughput"""
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            now = time.time()
+            recent = [seconds for finished_at, seconds in self._completed if now - finished_at <= 60]
+            return {
+                "queued": counts.get("queued", 0),
+                "printing": counts.get("printing", 0),
+                "failed": counts.get("failed", 0),
+                "completed": self._completed_count,
+                "jobs_per_minute": len(recent),
+                "avg_job_seconds": sum(recent) / len(recent) if recent else None,
+            }
+
+    def stop(self):
+        """Ask run() to return once in-flight jobs are finished"""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+
+    def close(self):
+        """Close the database; call after run() has returned"""
+        with self._lock:
+            self._db.close()
+
+    def _claim(self):
+        """Mark the oldest job that may be printed now as printing; caller holds the lock"""
+        now = time.time()
+        rows = self._db.execute(
+            "SELECT id, printer_url FROM jobs WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY id", (now,)
+        ).fetchall()
+        for job_id, printer_url in rows:
+            limit = self.printer_limits.get(printer_url, self.printer_limit)
+            if self._in_flight.get(printer_url, 0) < limit:
+                self._db.execute("UPDATE jobs SET status = 'printing' WHERE id = ?", (job_id,))
+                self._in_flight[printer_url] = self._in_flight.get(printer_url, 0) + 1
+                return self._db.execute(
+                    "SELECT id, printer_url, document_format, data, request, length_cm, attempts "
+                    "FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+        return None
+
+    def _next_wakeup(self) -> float:
+        """Seconds until the next delayed retry becomes due; caller holds the lock"""
+        due = self._db.execute(
+            "SELECT MIN(next_attempt_at) FROM jobs WHERE status = 'queued' AND next_attempt_at > ?",
+            (time.time(),),
+        ).fetchone()[0]
+        return max(0.05, due - time.time()) if due else None
+
+    def _print(self, job, on_progress, on_finished, on_error):
+        job_id, printer_url, document_format, data, request, length_cm, attempts = job
+        started = time.time()
+        try:
+            if data is None:
+                # Deferred job: rendered while it is sent, again on every attempt
+                data = self.render(json.loads(request), on_progress)
+            on_progress(f"Sending to printer... (job {job_id})")
+            printer_job_id = self.submit(printer_url, data, document_format)
+
+            with self._wakeup:
+                self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                self._completed.append((time.time(), time.time() - started))
+                self._completed_count += 1
+            on_finished(f"Print job completed successfully ({length_cm:.1f}cm, printer job {printer_job_id})")
+        except Exception as e:
+            attempts += 1
+            with self._wakeup:
+                if attempts < self.max_attempts:
+                    delay = self.backoff_seconds * (2 ** (attempts - 1))
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'queued', attempts = ?, next_attempt_at = ?, error = ? WHERE id = ?",
+                        (attempts, time.time() + delay, str(e), job_id),
+                    )
+                    message = f"Error: {str(e)} (retrying job {job_id} in {delay:.0f}s)"
+                else:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'failed', attempts = ?, data = NULL, error = ? WHERE id = ?",
+                        (attempts, str(e), job_id),
+                    )
+                    message = f"Error: {str(e)}"
+            on_error(message)
+        finally:
+            with self._wakeup:
+                self._in_flight[printer_url] -= 1
+                self._wakeup.notify_all()
+
+    def run(self, on_progress, on_finished, on_error, on_stats=None):
+        """Drain the queue until stop() is called; blocks the calling thread"""
+        def report():
+            if on_stats:
+                on_stats(self.stats())
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="print-job") as pool:
+            report()
+            while True:
+                with self._wakeup:
+                    job = None
+                    while not self._stopping:
+                        if sum(self._in_flight.values()) < self.max_workers:
+                            job = self._claim()
+                            if job:
+                                break
+                        self._wakeup.wait(self._next_wakeup())
+                    if self._stopping:
+                        break
+
+                future = pool.submit(self._print, job, on_progress, on_finished, on_error)
+                future.add_done_callback(lambda _: report())
+                report()
@@ -0,0 +1,267 @@
+"""Pools of printers that share the jobs sent to one pool:// URL"""
+import json
+import os
+import threading
+import time
+
+from ipp import DOCUMENT_FORMAT
+from paths import data_path
+from printing import PrintError, submit_job
+
+POOL_SCHEME = "pool://"
+STRATEGIES = ("least-loaded", "round-robin")
+
+
+def pool_url(name: str) -> str:
+    return f"{POOL_SCHEME}{name}"
+
+
+def is_pool_url(printer_url: str) -> bool:
+    return printer_url.startswith(POOL_SCHEME)
+
+
+class PrinterPool:
+    """Printers that take turns printing the jobs of one pool.
+
+    Every job goes to a healthy printer picked by the strategy:
+    least-loaded sends it where it should finish first (jobs in flight
+    times the printer's average job latency), round-robin takes turns
+    weighted by how fast each printer has been. Printers without a
+    measured latency yet count as the fastest.
+
+    A printer that fails max_failures jobs in a row is ejected for
+    cooldown seconds, twice as long after every further ejection, and
+    then gets a single job to prove itself. Failed jobs move on to the
+    next healthy printer; streamed documents can only be sent once.
+    """
+
+    def __init__(self, name: str, printers: list, strategy: str = "least-loaded", max_failures: int = 2,
+                 cooldown: float = 30.0, submit=submit_job):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown pool strategy: {strategy}")
+        if not printers:
+            raise ValueError("A printer pool needs at least one printer")
+        self.name = name
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.submit_job = submit  # submit(printer_url, data, document_format) -> job id, raises PrintError
+
+        self._lock = threading.Lock()
+        self._members = [
+            {
+                "url": url,
+                "in_flight": 0,
+                "latency": None,  # Moving average of job seconds
+                "jobs": 0,
+                "errors": 0,
+                "failures": 0,  # In a row
+                "ejections": 0,  # In a row
+                "ejected_until": 0.0,
+                "turn": 0.0,  # Smooth weighted round-robin credit
+                "last_error": None,
+            }
+            for url in dict.fromkeys(printers)
+        ]
+
+    @property
+    def url(self) -> str:
+        return pool_url(self.name)
+
+    @property
+    def printers(self) -> list:
+        return [member["url"] for member in self._members]
+
+    def _available(self, member: dict, now: float) -> bool:
+        if member["ejected_until"] > now:
+            return False
+        # Back from an ejection: one job at a time until it succeeds
+        return member["ejections"] == 0 or member["in_flight"] == 0
+
+    def _acquire(self, exclude: list) -> dict:
+        """Pick the printer for the next job and count it as busy"""
+        with self._lock:
+            now = time.time()
+            candidates = [m for m in self._members if m["url"] not in exclude and self._available(m, now)]
+            if not candidates:
+                return None
+
+            # Printers not measured yet are assumed to be as fast as the fastest one
+            known = [m["latency"] for m in candidates if m["latency"]]
+            fallback = min(known) if known else 1.0
+            if self.strategy == "least-loaded":
+                member = min(candidates, key=lambda m: (
+                    (m["in_flight"] + 1) * (m["latency"] or fallback), m["in_flight"]
+                ))
+            else:
+                weights = [1.0 / (m["latency"] or fallback) for m in candidates]
+                for m, weight in zip(candidates, weights):
+                    m["turn"] += weight
+                member = max(candidates, key=lambda m: m["turn"])
+                member["turn"] -= sum(weights)
+
+            member["in_flight"] += 1
+            return member
+
+    def _release(self, member: dict, seconds: float = None, error: Exception = None):
+        """Finish a job on a printer, recording its latency or its error if given"""
+        with self._lock:
+            member["in_flight"] -= 1
+            if seconds is None and error is None:
+                return
+            if error is None:
+                member["jobs"] += 1
+                member["failures"] = 0
+                member["ejections"] = 0
+                member["ejected_until"] = 0.0
+                latency = member["latency"]
+                member["latency"] = seconds if latency is None else 0.7 * latency + 0.3 * seconds
+                return
+
+            member["errors"] += 1
+            member["failures"] += 1
+            member["last_error"] = str(error)
+            if member["failures"] >= self.max_failures:
+                member["ejected_until"] = time.time() + self.cooldown * 2 ** member["ejections"]
+                member["ejections"] += 1
+
+    def submit(self, data, document_format: str = DOCUMENT_FORMAT):
+        """Print on a healthy printer of the pool, trying the others if it fails; returns the job id"""
+        # A stream of chunks is consumed by the first attempt
+        retryable = isinstance(data, (bytes, bytearray))
+        tried = []
+        while True:
+            member = self._acquire(tried)
+            if member is None:
+                if tried:
+                    raise PrintError(f"Every printer in pool {self.name} failed: {self._last_error(tried[-1])}")
+                raise PrintError(f"No healthy printers in pool {self.name}")
+
+            started = time.perf_counter()
+            try:
+                job_id = self.submit_job(member["url"], data, document_format)
+            except PrintError as e:
+                self._release(member, error=e)
+                if not retryable:
+                    raise
+                tried.append(member["url"])
+                continue
+            except BaseException:
+                # Not necessarily the printer's fault, e.g. the document failed to render:
+                # counts as neither success nor failure, but is no longer in flight
+                self._release(member)
+                raise
+            self._release(member, time.perf_counter() - started)
+            return job_id
+
+    def _last_error(self, printer_url: str) -> str:
+        with self._lock:
+            return next(m["last_error"] for m in self._members if m["url"] == printer_url)
+
+    def stats(self) -> dict:
+        """Strategy and per-printer health, load and latency"""
+        with self._lock:
+            now = time.time()
+            return {
+                "name": self.name,
+                "url": self.url,
+                "strategy": self.strategy,
+                "printers": [
+                    {
+                        "url": m["url"],
+                        "healthy": m["ejected_until"] <= now,
+                        "ejected_for": max(0.0, m["ejected_until"] - now),
+                        "in_flight": m["in_flight"],
+                        "jobs": m["jobs"],
+                        "errors": m["errors"],
+                        "avg_job_seconds": m["latency"],
+                        "last_error": m["last_error"],
+                    }
+                    for m in self._members
+                ],
+            }
+
+
+class PrinterPools:
+    """Named printer pools, saved to disk.
+
+    submit() has the signature of printing.submit_job and is what the print
+    queue calls: pool:// URLs are spread over the pool's printers, anything
+    else goes straight to that printer.
+    """
+
+    def __init__(self, path: str = None, submit=submit_job):
+        self.path = path or data_path("printer_pools.json")
+        self.submit_job = submit
+        self._lock = threading.Lock()
+        self._pools = {}
+
+        for name, definition in self._load().items():
+            try:
+                self._pools[name] = self._pool(name, definition["printers"], definition.get("strategy"))
+            except (KeyError, ValueError) as e:
+                print(f"Error loading printer pool {name}: {str(e)}")
+
+    def _pool(self, name: str, printers: list, strategy: str = None) -> PrinterPool:
+        return PrinterPool(name, printers, strategy or "least-loaded", submit=self.submit_job)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        definitions = {pool.name: {"printers": pool.printers, "strategy": pool.strategy}
+                       for pool in self._pools.values()}
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(definitions, f)
+        except OSError as e:
+            print(f"Error saving printer pools: {str(e)}")
+
+    def create(self, name: str, printers: list, strategy: str = "least-loaded") -> PrinterPool:
+        """Define (or redefine) a pool and return it"""
+        if not name or "/" in name:
+            raise ValueError(f"Invalid pool name: {name!r}")
+        pool = self._pool(name, printers, strategy)
+        with self._lock:
+            self._pools[name] = pool
+            self._save()
+        return pool
+
+    def remove(self, name: str):
+        with self._lock:
+            if self._pools.pop(name, None):
+                self._save()
+
+    def get(self, printer_url: str) -> PrinterPool:
+        """The pool behind a pool:// URL, or None"""
+        if not is_pool_url(printer_url):
+            return None
+        with self._lock:
+            return self._pools.get(printer_url[len(POOL_SCHEME):])
+
+    def printers(self) -> list:
+        """Pools as entries of a printer list, [{"name", "url", "device"}]"""
+        with self._lock:
+            return [
+                {"name": f"{pool.name} (pool of {len(pool.printers)})", "url": pool.url, "device": pool.url}
+                for pool in self._pools.values()
+            ]
+
+    def stats(self) -> list:
+        with self._lock:
+            pools = list(self._pools.values())
+        return [pool.stats() for pool in pools]
+
+    def submit(self, printer_url: str, data, document_format: str = DOCUMENT_FORMAT):
+        """Print to a printer or a pool:// URL and return the printer's job id"""
+        if not is_pool_url(printer_url):
+            return self.submit_job(printer_url, data, document_format)
+        pool = self.get(printer_url)
+        if pool is None:
+            raise PrintError(f"Unknown printer pool: {printer_url[len(POOL_SCHEME):]}")
+        return pool.submit(data, document_format)
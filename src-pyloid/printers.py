@@ -0,0 +1,151 @@
+"""Background printer discovery with a cached, pre-resolved printer list"""
+import json
+import os
+import subprocess
+import threading
+from urllib.parse import unquote, urlsplit
+
+import mdns
+from paths import data_path
+from printing import PrintError, resolve_printer_url
+
+
+def list_lpstat() -> list:
+    """(name, device URL) of every printer CUPS knows about"""
+    try:
+        result = subprocess.run(['lpstat', '-v'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return []
+
+    printers = []
+    for line in result.stdout.split('\n'):
+        if ':' in line:  # Any printer entry
+            # Extract printer name and URL/device
+            parts = line.split(':', 1)
+            words = parts[0].split()
+            if words:
+                printers.append((words[-1], parts[1].strip()))  # Last word before colon
+    return printers
+
+
+def service_url(service: dict) -> str:
+    """IPP URL of a printer found over mDNS"""
+    host = service["address"] or service["host"].rstrip(".")
+    path = service["txt"].get("rp", "ipp/print").lstrip("/")
+    return f"ipp://{host}:{service['port']}/{path}"
+
+
+def dnssd_instance(device_url: str) -> str:
+    """Service instance name of a dnssd:// device URL, lowercased for matching"""
+    return unquote(urlsplit(device_url).netloc).rstrip(".").lower()
+
+
+class PrinterRegistry:
+    """Printers from lpstat and mDNS, refreshed in the background.
+
+    printers() always answers from memory. The list is saved to disk so the
+    previous session's printers show up immediately on the next launch,
+    while run() rediscovers them every ttl seconds (or on refresh()) and
+    reports changes through a callback. dnssd:// devices are resolved to
+    concrete ipp:// endpoints once per discovery rather than on every print.
+    """
+
+    def __init__(self, ttl: float = 60.0, cache_path: str = None, browse_timeout: float = 1.5):
+        self.ttl = ttl
+        self.cache_path = cache_path or data_path("printers.json")
+        self.browse_timeout = browse_timeout
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._refresh_requested = False
+        self._stopping = False
+        self._printers = self._load()
+
+    def _load(self) -> list:
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _save(self, printers: list):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            with open(self.cache_path, "w") as f:
+                json.dump(printers, f)
+        except OSError as e:
+            print(f"Error saving printer list: {str(e)}")
+
+    def printers(self) -> list:
+        """Last known printers as [{"name", "url", "device"}], without blocking"""
+        with self._lock:
+            return [dict(printer) for printer in self._printers]
+
+    def resolve(self, printer_url: str) -> str:
+        """IPP URL for a printer URL, using the discovered endpoint when there is one"""
+        with self._lock:
+            for printer in self._printers:
+                if printer_url in (printer["url"], printer["device"]):
+                    return printer["url"]
+        return resolve_printer_url(printer_url)
+
+    def discover(self) -> list:
+        """Query lpstat and mDNS once and merge the results"""
+        services = mdns.browse(timeout=self.browse_timeout)
+        by_instance = {service["instance"].rstrip(".").lower(): service for service in services}
+
+        printers = []
+        seen = set()
+        for name, device in list_lpstat():
+            if device.startswith("dnssd://") and dnssd_instance(device) in by_instance:
+                url = service_url(by_instance[dnssd_instance(device)])
+            else:
+                try:
+                    url = resolve_printer_url(device)
+                except PrintError:
+                    url = device  # Not an IPP printer, keep it listed as CUPS reports it
+            seen.add(url)
+            printers.append({"name": f"{name} ({device})", "url": url, "device": device})
+
+        # Network printers CUPS hasn't been told about
+        for service in services:
+            url = service_url(service)
+            if url not in seen:
+                seen.add(url)
+                printers.append({"name": f"{service['name']} ({url})", "url": url, "device": url})
+        return printers
+
+    def refresh(self):
+        """Rediscover printers now instead of waiting for the TTL"""
+        with self._wakeup:
+            self._refresh_requested = True
+            self._wakeup.notify()
+
+    def stop(self):
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+
+    def run(self, on_change):
+        """Rediscover printers until stop(), calling on_change(printers) whenever the list changes"""
+        while True:
+            try:
+                printers = self.discover()
+            except Exception as e:
+                print(f"Error getting printers: {str(e)}")
+                printers = None
+
+            if printers is not None:
+                with self._lock:
+                    changed = printers != self._printers
+                    self._printers = printers
+                if changed:
+                    self._save(printers)
+                    on_change(self.printers())
+
+            with self._wakeup:
+                if not self._refresh_requested and not self._stopping:
+                    self._wakeup.wait(self.ttl)
+                self._refresh_requested = False
+                if self._stopping:
+                    return
@@ -0,0 +1,36 @@
+"""Submitting print jobs to the sticky note printer"""
+from ipp import DOCUMENT_FORMAT, IPPError, get_client
+from tracing import tracer
+
+
+class PrintError(Exception):
+    """A print job could not be submitted"""
+
+
+def resolve_printer_url(printer_url: str) -> str:
+    """Turn a printer URL as reported by lpstat into an IPP URL"""
+    if not printer_url:
+        raise PrintError("No printer selected")
+
+    # Clean up the printer URL - ensure it's in the correct format
+    if "ipp://" in printer_url:
+        return printer_url
+    if "dnssd://" in printer_url:
+        # Convert dnssd URL to IPP URL format
+        try:
+            name = printer_url.split("(")[1].split(")")[0]
+        except IndexError:
+            raise PrintError(f"Invalid printer URL: {printer_url}")
+        return f"ipp://{name}.local:631/ipp/print"
+
+    raise PrintError("Invalid printer URL")
+
+
+def submit_job(printer_url: str, data, document_format: str = DOCUMENT_FORMAT) -> int:
+    """Send a document (bytes or byte chunks) to the printer over IPP and return the printer's job id"""
+    try:
+        with tracer.span("print.ipp", bytes=len(data) if isinstance(data, (bytes, bytearray)) else None):
+            response = get_client(resolve_printer_url(printer_url)).print_job(data, document_format)
+    except IPPError as e:
+        raise PrintError(str(e))
+    return response.job_id
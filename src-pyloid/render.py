@@ -0,0 +1,319 @@
+"""Rasterization helpers for rendered text stickers"""
+from collections import OrderedDict
+import hashlib
+import io
+import threading
+
+from PIL import Image, ImageChops, ImageDraw
+
+from fonts import LoadedFont
+from layout import TextLayout
+
+
+# Printer is monochrome: anything darker than mid-gray prints black
+THRESHOLD = 128
+
+
+def to_monochrome(image: Image.Image, threshold: int = THRESHOLD) -> Image.Image:
+    """Threshold a grayscale render to 1-bit in a single pass"""
+    if image.mode != "L":
+        image = image.convert("L")
+    return image.point([0 if v < threshold else 255 for v in range(256)], "1")
+
+
+def encode_png(image: Image.Image, compress_level: int = 1) -> bytes:
+    """Encode an image as PNG in memory, favouring speed over size"""
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=compress_level)
+    return buffer.getvalue()
+
+
+def draw_lines(lines: list, font, line_height: int, image_width_px: int, side_margin_px: int,
+               top_margin: int, bottom_margin: int, progress_callback=None, mode: str = "L",
+               check_cancelled=None) -> Image.Image:
+    """Draw wrapped lines onto a new canvas (grayscale by default)
+
+    check_cancelled, if given, is called before each line and may raise to abandon the render.
+    """
+    image_height_px = (line_height * len(lines)) + top_margin + bottom_margin
+    image = Image.new(mode, (image_width_px, image_height_px), "white")
+    draw = ImageDraw.Draw(image)
+
+    # Draw text with margins
+    y = top_margin  # Start from top margin
+    total_lines = len(lines)
+
+    for i, line in enumerate(lines):
+        if check_cancelled:
+            check_cancelled()
+        draw.text((side_margin_px, y), line, fill="black", font=font)
+        y += line_height
+
+        if progress_callback and i % 10 == 0:
+            progress = 50 + int((i / total_lines) * 50)
+            progress_callback(f"Drawing text... {progress}%")
+
+    return image
+
+
+def band_lines(line_count: int, font, line_height: int, top_margin: int, band_top: int, band_bottom: int) -> range:
+    """Indices of the lines that may put ink on rows band_top..band_bottom"""
+    # Glyphs can reach past their line box, so neighbouring lines are included too
+    ascent, descent = font.getmetrics()
+    overflow = max(ascent + descent - line_height, 0) // line_height + 1
+
+    first = max(0, (band_top - top_margin) // line_height - overflow)
+    last = min(line_count, (band_bottom - top_margin) // line_height + overflow + 1)
+    return range(first, last)
+
+
+def draw_band(lines: list, font, line_height: int, image_width_px: int, side_margin_px: int,
+              top_margin: int, band_top: int, band_bottom: int) -> Image.Image:
+    """Draw rows band_top..band_bottom of the full text canvas onto a new grayscale band"""
+    band = Image.new("L", (image_width_px, band_bottom - band_top), "white")
+    draw = ImageDraw.Draw(band)
+
+    # Lines reaching into the band from above or below are clipped to it
+    for i in band_lines(len(lines), font, line_height, top_margin, band_top, band_bottom):
+        y = top_margin + i * line_height - band_top
+        draw.text((side_margin_px, y), lines[i], fill="black", font=font)
+    return band
+
+
+def iter_bands(lines: list, font, line_height: int, image_width_px: int, side_margin_px: int,
+               top_margin: int, bottom_margin: int, band_height: int = 1024, progress_callback=None):
+    """Yield the rendered text as consecutive grayscale bands, top to bottom.
+
+    Stitched together, the bands are identical to draw_lines(); only one
+    band is held in memory at a time.
+    """
+    image_height_px = (line_height * len(lines)) + top_margin + bottom_margin
+    total_bands = -(-image_height_px // band_height)
+
+    for band_index, band_top in enumerate(range(0, image_height_px, band_height)):
+        band_bottom = min(band_top + band_height, image_height_px)
+        band = draw_band(lines, font, line_height, image_width_px, side_margin_px, top_margin, band_top, band_bottom)
+
+        if progress_callback:
+            progress_callback(f"Rendering band {band_index + 1}/{total_bands}...")
+        yield band
+
+
+class RenderedParagraph:
+    """Wrapped lines of one input paragraph and its rasterized strip"""
+
+    __slots__ = ("lines", "strip", "offset")
+
+    def __init__(self, lines: list, strip: Image.Image = None, offset: tuple = (0, 0)):
+        self.lines = lines
+        self.strip = strip  # Cropped to the inked area, None if nothing is drawn
+        self.offset = offset  # Position of the strip relative to the first line's origin
+
+    @property
+    def nbytes(self) -> int:
+        return self.strip.width * self.strip.height if self.strip else 0
+
+
+class IncrementalRenderer:
+    """Renders text paragraph by paragraph, reusing unchanged paragraphs.
+
+    Each input paragraph (one line of the source text) is wrapped and drawn
+    into its own grayscale strip, cached by a hash of its content and the
+    layout parameters. Re-rendering after an edit only re-wraps and re-draws
+    the paragraphs that changed; the rest are composited from the cache.
+    A document larger than max_bytes keeps the strips that fit instead of
+    evicting its own earlier paragraphs. Rows where glyphs of neighbouring
+    paragraphs touch are drawn again in order, so the result is identical
+    to draw_lines().
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024, max_bands: int = 4096):
+        self.max_bytes = max_bytes
+        self.max_bands = max_bands
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._paragraphs = OrderedDict()
+        self._bands = OrderedDict()  # Redrawn rows where paragraphs touch, a few rows each
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._paragraphs.get(key)
+            if entry is not None:
+                self._paragraphs.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry
+
+    def _put(self, key, entry: RenderedParagraph, keep=()):
+        """Cache a strip, evicting least recently used strips that are not in keep"""
+        with self._lock:
+            old = self._paragraphs.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            # layout() moves the strips it keeps to the end, so the others come first
+            while self._bytes + entry.nbytes > self.max_bytes and self._paragraphs:
+                oldest = next(iter(self._paragraphs))
+                if oldest in keep:
+                    break
+                self._bytes -= self._paragraphs.pop(oldest).nbytes
+            if self._bytes + entry.nbytes > self.max_bytes and self._paragraphs:
+                # Full of this document's strips: evicting them would only miss them next time
+                return
+            self._paragraphs[key] = entry
+            self._bytes += entry.nbytes
+
+    def clear(self):
+        """Drop all cached paragraphs"""
+        with self._lock:
+            self._paragraphs.clear()
+            self._bands.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters and cache size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "paragraphs": len(self._paragraphs),
+                "bytes": self._bytes,
+            }
+
+    def _render_paragraph(self, paragraph: str, loaded_font: LoadedFont, layout: TextLayout,
+                          image_width_px: int, side_margin_px: int) -> RenderedParagraph:
+        lines = layout.wrap_paragraph(paragraph)
+        if not paragraph.strip():
+            return RenderedParagraph(lines)
+
+        # Glyphs can reach past the line box (descenders, accents), so pad the strip
+        line_height = loaded_font.line_height
+        ascent, descent = loaded_font.font.getmetrics()
+        pad = max(ascent + descent - line_height, 0)
+
+        strip = Image.new("L", (image_width_px, line_height * len(lines) + 2 * pad), 255)
+        draw = ImageDraw.Draw(strip)
+        y = pad
+        for line in lines:
+            draw.text((side_margin_px, y), line, fill=0, font=loaded_font.font)
+            y += line_height
+
+        # Only keep the inked area, short lines leave most of the strip blank
+        bbox = ImageChops.invert(strip).getbbox()
+        if bbox is None:
+            return RenderedParagraph(lines)
+        return RenderedParagraph(lines, strip.crop(bbox), (bbox[0], bbox[1] - pad))
+
+    def layout(self, text: str, loaded_font: LoadedFont, usable_width: int, image_width_px: int,
+               side_margin_px: int, progress_callback=None, check_cancelled=None) -> list:
+        """Wrap and rasterize every paragraph of text, using the cache where possible"""
+        layout = TextLayout(loaded_font.font, usable_width, loaded_font.glyphs)
+        params = (loaded_font.font_path, loaded_font.scaled_size, usable_width, image_width_px, side_margin_px)
+
+        paragraphs = []
+        text_lines = text.split('\n')
+        total_lines = len(text_lines)
+        keys = [(hashlib.blake2b(paragraph.encode(), digest_size=16).digest(), params) for paragraph in text_lines]
+        keep = set(keys)  # Strips of this document must not evict each other
+        with self._lock:
+            # Move them behind everything else, so strips of other texts are evicted first
+            for key in keys:
+                if key in self._paragraphs:
+                    self._paragraphs.move_to_end(key)
+
+        for i, (paragraph, key) in enumerate(zip(text_lines, keys)):
+            if check_cancelled:
+                check_cancelled()
+            entry = self._get(key)
+            if entry is None:
+                entry = self._render_paragraph(paragraph, loaded_font, layout, image_width_px, side_margin_px)
+                self._put(key, entry, keep)
+            paragraphs.append(entry)
+
+            if progress_callback and i % 10 == 0:
+                progress = int((i / total_lines) * 50)
+                progress_callback(f"Processing text... {progress}%")
+
+        return paragraphs
+
+    def _draw_band(self, lines: list, loaded_font: LoadedFont, image_width_px: int, side_margin_px: int,
+                   top_margin: int, band_top: int, band_bottom: int) -> Image.Image:
+        """draw_band() of the rows where two paragraphs touch, cached by the lines it draws"""
+        line_height = loaded_font.line_height
+        needed = band_lines(len(lines), loaded_font.font, line_height, top_margin, band_top, band_bottom)
+        # Where the band's first line starts, relative to the band
+        shift = top_margin + needed.start * line_height - band_top
+        key = (
+            loaded_font.font_path, loaded_font.scaled_size, image_width_px, side_margin_px,
+            shift, band_bottom - band_top, tuple(lines[needed.start:needed.stop])
+        )
+
+        with self._lock:
+            band = self._bands.get(key)
+            if band is not None:
+                self._bands.move_to_end(key)
+                return band
+
+        band = draw_band(lines[needed.start:needed.stop], loaded_font.font, line_height, image_width_px,
+                         side_margin_px, shift, 0, band_bottom - band_top)
+        with self._lock:
+            self._bands[key] = band
+            while len(self._bands) > self.max_bands:
+                self._bands.popitem(last=False)
+        return band
+
+    def compose(self, paragraphs: list, loaded_font: LoadedFont, image_width_px: int, side_margin_px: int,
+                top_margin: int, bottom_margin: int, check_cancelled=None) -> Image.Image:
+        """Composite cached paragraph strips into a single grayscale canvas, identical to draw_lines()"""
+        line_height = loaded_font.line_height
+        total_lines = sum(len(p.lines) for p in paragraphs)
+        image_height_px = (line_height * total_lines) + top_margin + bottom_margin
+        image = Image.new("L", (image_width_px, image_height_px), 255)
+
+        collisions = []  # Row ranges where glyphs of neighbouring paragraphs ink the same pixels
+        inked_bottom = 0
+        y = top_margin
+        for paragraph in paragraphs:
+            if check_cancelled:
+                check_cancelled()
+            strip = paragraph.strip
+            if strip is not None:
+                left = paragraph.offset[0]
+                top = y + paragraph.offset[1]
+
+                # Clip to the canvas, as drawing directly onto it would
+                src_top = max(0, -top)
+                bottom = min(image_height_px, top + strip.height)
+                if bottom > top + src_top:
+                    if src_top or bottom < top + strip.height:
+                        strip = strip.crop((0, src_top, strip.width, bottom - top))
+                    top += src_top
+                    box = (left, top, left + strip.width, bottom)
+                    under = image.crop(box)
+
+                    if top < inked_bottom:
+                        both = ImageChops.darker(ImageChops.invert(under), ImageChops.invert(strip)).getbbox()
+                        if both is not None:
+                            collision = (top + both[1], top + both[3])
+                            if collisions and collision[0] <= collisions[-1][1]:
+                                collisions[-1] = (collisions[-1][0], max(collisions[-1][1], collision[1]))
+                            else:
+                                collisions.append(collision)
+                    inked_bottom = max(inked_bottom, bottom)
+
+                    # Exact wherever only one paragraph has ink, multiplying by white is a no-op
+                    image.paste(ImageChops.multiply(under, strip), box)
+            y += line_height * len(paragraph.lines)
+
+        if collisions:
+            # Overlapping anti-aliased glyphs don't blend exactly like overdraw, so
+            # those rows are drawn again the way draw_lines() would
+            lines = [line for paragraph in paragraphs for line in paragraph.lines]
+            for band_top, band_bottom in collisions:
+                band = self._draw_band(lines, loaded_font, image_width_px, side_margin_px,
+                                       top_margin, band_top, band_bottom)
+                image.paste(band, (0, band_top))
+
+        return image
@@ -0,0 +1,177 @@
+"""On-disk cache of printer-ready bitmaps, addressed by a hash of their inputs"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+from PIL import Image
+
+from paths import data_path
+
+
+_file_digests = {}
+_file_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """Hash of a file's contents, recomputed only when its size or mtime changes"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _file_digests_lock:
+        digest = _file_digests.get(key)
+    if digest is None:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _file_digests_lock:
+            _file_digests[key] = digest
+    return digest
+
+
+def cache_key(kind: str, data: bytes, **settings) -> str:
+    """Key for a render of data (text or image bytes) with the settings that affect its pixels"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(kind.encode())
+    h.update(b"\0")
+    h.update(json.dumps(settings, sort_keys=True).encode())
+    h.update(b"\0")
+    h.update(data)
+    return h.hexdigest()
+
+
+def decode_bmp(data: bytes) -> Image.Image:
+    """The 1-bit image a cached (flipped) BMP was encoded from"""
+    # Read the rows directly: Image.open would take a long sticker for a decompression bomb
+    offset, _, width, height, _, bits = struct.unpack_from("<IIiiHH", data, 10)
+    if data[:2] != b"BM" or bits != 1 or width <= 0 or height <= 0:
+        raise ValueError("Not a cached 1-bit BMP")
+    stride = ((width + 7) // 8 + 3) & ~3
+    # Flipped BMPs store the top row first; set bits are white, like mode "1"
+    rows = np.frombuffer(data, dtype=np.uint8, count=stride * height, offset=offset).reshape(height, stride)
+    return Image.frombytes("1", (width, height), rows[:, :(width + 7) // 8].tobytes())
+
+
+class RenderCache:
+    """Content-addressed BMP files with size-bounded LRU eviction.
+
+    Each entry is one file named after its key. Hits refresh the file's
+    mtime, so the least recently used entries are the oldest files and
+    the cache keeps working across restarts. Writes go through a temporary
+    file and a rename, so a crash never leaves a truncated entry behind.
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory or data_path("render_cache")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._total_bytes = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bmp")
+
+    def _scan(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".bmp") and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+            elif entry.name.endswith(".tmp"):
+                os.remove(entry.path)  # Left over from an interrupted write
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def get(self, key: str):
+        """Cached BMP bytes for a key, or None"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            # Deleted behind our back
+            with self._lock:
+                if key in self._entries:
+                    self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Store BMP bytes under a key, evicting the least recently used entries if needed"""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                # Same key, same content: already stored
+                self._entries.move_to_end(key)
+                return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing render cache: {str(e)}")
+            return
+
+        evicted = []
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes:
+                old_key, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Delete every entry"""
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self._total_bytes = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        """Hit/miss counters, hit rate and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,256 @@
+"""Rendering and printing core, usable without the Pyloid window.
+
+Nothing here imports Qt or Pyloid, so it can be used from scripts, worker
+processes and the batch command as well as from the app's bridge.
+"""
+from collections import OrderedDict
+import os
+import threading
+
+from PIL import Image
+
+from fonts import font_cache
+from imaging import prepare_photo, stream_bmp
+from layout import TextLayout
+from render_cache import cache_key, file_digest
+from tracing import tracer
+from render import IncrementalRenderer, draw_band, draw_lines, encode_png, iter_bands, to_monochrome
+
+IMAGE_WIDTH_PX = 576  # Fixed width for thermal printer
+PHOTO_DPI = 203  # Resolution photos are printed at
+CANVAS_DPI = 203  # ASSNP uses 203 DPI (8 dots/mm)
+
+FONT_PATHS = [
+    "src-pyloid/assets/SpaceMono-Regular.ttf",  # Local development path
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "SpaceMono-Regular.ttf"),
+]
+
+# System font fallbacks
+FALLBACK_FONT_PATHS = [
+    "/System/Library/Fonts/Helvetica.ttc",  # macOS fallback
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  # Linux fallback
+    "C:\\Windows\\Fonts\\arial.ttf",  # Windows fallback
+]
+
+
+def find_font_path(extra_paths=()) -> str:
+    """Get the path to the font file, falling back to system fonts if needed"""
+    for path in FONT_PATHS + list(extra_paths) + FALLBACK_FONT_PATHS:
+        if os.path.exists(path):
+            return path
+
+    raise OSError("No suitable font found. Please install Space Mono or ensure system fonts are available.")
+
+
+def length_cm(image: Image.Image, dpi: int) -> float:
+    """Printed length of an image, margins included"""
+    return (image.height / dpi) * 2.54
+
+
+def render_photo(image: Image.Image, method: str = "floyd-steinberg") -> tuple:
+    """Dither a photo for the printer, returning (image, length_cm)"""
+    with tracer.span("photo.prepare", method=method, width=image.width, height=image.height):
+        bilevel = prepare_photo(image, method)
+    return bilevel, length_cm(bilevel, PHOTO_DPI)
+
+
+def photo_cache_key(data: bytes, method: str = "floyd-steinberg") -> str:
+    """Render cache key for a photo file's bytes"""
+    # Version 2: photos are loaded upright and reduced before resizing (load_photo)
+    return cache_key("photo", data, width=IMAGE_WIDTH_PX, dpi=PHOTO_DPI, dither=method, version=2)
+
+
+def render_canvas(image: Image.Image) -> Image.Image:
+    """Scale a canvas rendered by the window (markdown) to the printer width and make it 1-bit"""
+    with tracer.span("canvas.convert", width=image.width, height=image.height):
+        # Ensure exact printer width
+        if image.width != IMAGE_WIDTH_PX:
+            height = int((IMAGE_WIDTH_PX / image.width) * image.height)
+            image = image.resize((IMAGE_WIDTH_PX, height), Image.Resampling.LANCZOS)
+
+        # Set the DPI metadata to match the printer's requirements
+        image.info['dpi'] = (CANVAS_DPI, CANVAS_DPI)
+
+        # Convert to monochrome (1-bit)
+        return image.convert('1')
+
+
+def canvas_cache_key(data: bytes) -> str:
+    """Render cache key for a canvas PNG's bytes"""
+    return cache_key("canvas", data, width=IMAGE_WIDTH_PX, dpi=CANVAS_DPI)
+
+
+class StickerRenderer:
+    """Renders text stickers with one font, caching what can be reused between renders"""
+
+    def __init__(self, font_path: str = None):
+        # Resolve the font once; the loaded fonts themselves are cached per (size, DPI)
+        self.font_path = font_path or find_font_path()
+        self.paragraph_renderer = IncrementalRenderer()
+
+    def clear(self):
+        """Drop cached fonts and paragraphs"""
+        font_cache.invalidate()
+        self.paragraph_renderer.clear()
+
+    def cache_key(self, text: str, dpi: int, font_size: int, margin_cm: float = 0) -> str:
+        """Render cache key for text with these settings and the current font file"""
+        return cache_key(
+            "text", text.encode("utf-8"), width=IMAGE_WIDTH_PX, dpi=dpi, font_size=font_size,
+            margin_cm=margin_cm, font=file_digest(self.font_path)
+        )
+
+    def metrics(self, dpi: int, font_size: int, margin_cm: float):
+        """Font, side margin and top/bottom margin in pixels for a text render"""
+        loaded_font = font_cache.get(self.font_path, font_size, dpi)
+        side_margin_px = int(0.03 * dpi)  # Horizontal margin
+        margin_px = int((margin_cm / 2.54) * dpi)  # Convert cm to inches to pixels
+        base_margin = int(0.05 * dpi)  # Default minimal margin
+        return loaded_font, side_margin_px, margin_px + base_margin  # Add user margin to base margin
+
+    def render_text(self, text: str, dpi: int, font_size: int, margin_cm: float = 0, progress_callback=None,
+                    incremental: bool = False, check_cancelled=None) -> tuple:
+        """Render text to a 1-bit image, returning (image, length_cm)
+
+        The text is drawn in grayscale and thresholded once. With
+        incremental=True, paragraphs that are unchanged since a previous
+        call are composited from cached strips instead of being re-drawn.
+        check_cancelled is called throughout the layout and drawing loops
+        and may raise to abandon a render that is no longer wanted.
+        """
+        image_width_px = IMAGE_WIDTH_PX
+        loaded_font, side_margin_px, vertical_margin = self.metrics(dpi, font_size, margin_cm)
+        font = loaded_font.font
+
+        if progress_callback:
+            progress_callback("Processing text...")
+
+        line_height = loaded_font.line_height
+        usable_width = image_width_px - (2 * side_margin_px)
+        top_margin = bottom_margin = vertical_margin
+
+        if incremental:
+            with tracer.span("render.paragraphs") as span:
+                paragraphs = self.paragraph_renderer.layout(
+                    text, loaded_font, usable_width, image_width_px, side_margin_px, progress_callback, check_cancelled
+                )
+                span["paragraphs"] = len(paragraphs)
+
+            if progress_callback:
+                progress_callback("Creating image...")
+
+            with tracer.span("render.compose"):
+                image = self.paragraph_renderer.compose(
+                    paragraphs, loaded_font, image_width_px, side_margin_px, top_margin, bottom_margin, check_cancelled
+                )
+        else:
+            # Wrap text into lines
+            with tracer.span("render.wrap") as span:
+                lines = TextLayout(font, usable_width, loaded_font.glyphs).wrap(text, progress_callback, check_cancelled)
+                span["lines"] = len(lines)
+
+            if progress_callback:
+                progress_callback("Creating image...")
+
+            with tracer.span("render.draw"):
+                image = draw_lines(
+                    lines, font, line_height, image_width_px, side_margin_px,
+                    top_margin, bottom_margin, progress_callback, check_cancelled=check_cancelled
+                )
+
+        # Render in grayscale and threshold once, the printer only does black and white
+        if check_cancelled:
+            check_cancelled()
+        with tracer.span("render.threshold", height=image.height):
+            image = to_monochrome(image)
+        return image, length_cm(image, dpi)
+
+    def stream_document(self, text: str, dpi: int, font_size: int, margin_cm: float,
+                        progress_callback=None) -> tuple:
+        """Lay out text and return (BMP document as a lazy stream of chunks, length_cm)
+
+        Bands are only rendered as the document is consumed, one at a time.
+        """
+        image_width_px = IMAGE_WIDTH_PX
+        loaded_font, side_margin_px, vertical_margin = self.metrics(dpi, font_size, margin_cm)
+        line_height = loaded_font.line_height
+        usable_width = image_width_px - (2 * side_margin_px)
+
+        # The layout pass is cheap and gives the total height needed for the BMP header
+        with tracer.span("render.wrap"):
+            lines = TextLayout(loaded_font.font, usable_width, loaded_font.glyphs).wrap(text, progress_callback)
+        image_height_px = (line_height * len(lines)) + 2 * vertical_margin
+
+        bands = iter_bands(
+            lines, loaded_font.font, line_height, image_width_px, side_margin_px,
+            vertical_margin, vertical_margin, progress_callback=progress_callback
+        )
+        # Bands are thresholded while they are packed, like to_monochrome would
+        document = stream_bmp(bands, image_width_px, image_height_px, "threshold")
+        return document, (image_height_px / dpi) * 2.54
+
+    def tiled(self, text: str, dpi: int, font_size: int, margin_cm: float = 0, tile_height: int = 512,
+              max_tiles: int = 64) -> "TiledText":
+        """Lay out text without rasterizing it, for drawing tiles on demand"""
+        return TiledText(self, text, dpi, font_size, margin_cm, tile_height, max_tiles)
+
+
+class TiledText:
+    """Text laid out once and rasterized in fixed-height tiles as they are needed.
+
+    Only the layout pass runs up front, so the total height is known
+    immediately and the first tile costs the same however long the
+    document is. Encoded tiles are kept in an LRU of max_tiles.
+    """
+
+    def __init__(self, renderer: StickerRenderer, text: str, dpi: int, font_size: int, margin_cm: float = 0,
+                 tile_height: int = 512, max_tiles: int = 64):
+        self.dpi = dpi
+        self.tile_height = tile_height
+        self.max_tiles = max_tiles
+        self.width = IMAGE_WIDTH_PX
+
+        self.loaded_font, self.side_margin_px, self.vertical_margin = renderer.metrics(dpi, font_size, margin_cm)
+        usable_width = self.width - (2 * self.side_margin_px)
+        with tracer.span("render.wrap"):
+            self.lines = TextLayout(self.loaded_font.font, usable_width, self.loaded_font.glyphs).wrap(text)
+        self.height = (self.loaded_font.line_height * len(self.lines)) + 2 * self.vertical_margin
+
+        self._tiles = OrderedDict()  # tile index -> PNG bytes
+        self._lock = threading.Lock()
+
+    @property
+    def tile_count(self) -> int:
+        return -(-self.height // self.tile_height)
+
+    @property
+    def length_cm(self) -> float:
+        return (self.height / self.dpi) * 2.54
+
+    def tile(self, index: int) -> Image.Image:
+        """1-bit image of one tile; the last tile may be shorter"""
+        if not 0 <= index < self.tile_count:
+            raise IndexError(f"Tile {index} out of range")
+        top = index * self.tile_height
+        bottom = min(top + self.tile_height, self.height)
+        band = draw_band(
+            self.lines, self.loaded_font.font, self.loaded_font.line_height, self.width,
+            self.side_margin_px, self.vertical_margin, top, bottom
+        )
+        return to_monochrome(band)
+
+    def tile_png(self, index: int) -> bytes:
+        """PNG of one tile, from the LRU when it was drawn recently"""
+        with self._lock:
+            data = self._tiles.get(index)
+            if data is not None:
+                self._tiles.move_to_end(index)
+                return data
+
+        with tracer.span("preview.tile"):
+            data = encode_png(self.tile(index))
+        with self._lock:
+            self._tiles[index] = data
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return data
@@ -0,0 +1,108 @@
+"""Per-stage timing spans with rolling percentiles and optional JSON-lines export"""
+from collections import deque
+from contextlib import contextmanager
+import itertools
+import json
+import os
+import threading
+import time
+
+
+class Tracer:
+    """Records how long each named stage takes.
+
+    Spans nest per thread: a span opened inside another becomes its child
+    and shares its trace id, so an exported trace shows where one preview
+    or print spent its time. The last `window` durations of every stage
+    are kept for percentiles.
+    """
+
+    def __init__(self, window: int = 512, export_path: str = None):
+        self.window = window
+        self._durations = {}  # stage -> deque of seconds
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self._export = None
+        if export_path:
+            self.export_to(export_path)
+
+    def export_to(self, path: str = None):
+        """Append every finished span to a JSON-lines file, or stop exporting with None"""
+        with self._lock:
+            if self._export:
+                self._export.close()
+                self._export = None
+            if path:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._export = open(path, "a", buffering=1)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time the enclosed block as one occurrence of a stage"""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else None
+        span_id = next(self._ids)
+        trace_id = parent[1] if parent else span_id
+        stack.append((span_id, trace_id))
+
+        started_at = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attributes  # The block may add attributes, e.g. output sizes
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            self._finish(name, seconds, {
+                "trace": trace_id,
+                "span": span_id,
+                "parent": parent[0] if parent else None,
+                "start": started_at,
+                **({"error": error} if error else {}),
+                **attributes,
+            })
+
+    def record(self, name: str, seconds: float, **attributes):
+        """Record a stage timed elsewhere"""
+        self._finish(name, seconds, {"start": time.time() - seconds, **attributes})
+
+    def _finish(self, name: str, seconds: float, details: dict):
+        with self._lock:
+            durations = self._durations.get(name)
+            if durations is None:
+                durations = self._durations[name] = deque(maxlen=self.window)
+            durations.append(seconds)
+            if self._export:
+                self._export.write(json.dumps({"name": name, "seconds": seconds, **details}, default=str) + "\n")
+
+    def percentiles(self) -> dict:
+        """p50/p90/p99/max in milliseconds and sample count of every stage"""
+        with self._lock:
+            snapshot = {name: sorted(durations) for name, durations in self._durations.items()}
+
+        def at(values, fraction):
+            return round(values[min(len(values) - 1, int(fraction * len(values)))] * 1000, 3)
+
+        return {
+            name: {
+                "count": len(values),
+                "p50_ms": at(values, 0.50),
+                "p90_ms": at(values, 0.90),
+                "p99_ms": at(values, 0.99),
+                "max_ms": round(values[-1] * 1000, 3),
+            }
+            for name, values in snapshot.items() if values
+        }
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+
+
+tracer = Tracer(export_path=os.environ.get("ASSNP_TRACE"))
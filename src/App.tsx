@@ -1,8 +1,20 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef, useCallback } from 'react';
 import './App.css';
 import { marked } from 'marked';
 import 'github-markdown-css/github-markdown.css';
 
+// Plain text longer than this is previewed in tiles drawn as they scroll into view
+const TILED_PREVIEW_CHARS = 20000;
+
+type TiledPreview = {
+  id: number,
+  width: number,
+  height: number,
+  tile_height: number,
+  tiles: number,
+  length: string
+};
+
 function App() {
   const [text, setText] = useState('');
   const [margin, setMargin] = useState(0);
@@ -18,6 +30,13 @@ function App() {
   const [selectedPrinter, setSelectedPrinter] = useState<string>('');
   const [isMarkdownMode, setIsMarkdownMode] = useState(false);
   const [imagePath, setImagePath] = useState('');
+  const [queueDepth, setQueueDepth] = useState(0);
+  const [tiledPreview, setTiledPreview] = useState<TiledPreview | null>(null);
+  const [tileUrls, setTileUrls] = useState<Record<number, string>>({});
+  const [visibleTiles, setVisibleTiles] = useState<[number, number]>([0, 0]);
+  const previewScrollRef = useRef<HTMLDivElement>(null);
+  // Tiles of the current tiled preview that are loaded or being fetched
+  const requestedTiles = useRef<{ id: number, indices: Set<number> }>({ id: 0, indices: new Set() });
 
   useEffect(() => {
     // Set up event listeners
@@ -43,16 +62,22 @@ function App() {
     };
 
     const handlePreviewReady = (data: { preview: string, length: string }) => {
+      setTiledPreview(null);
       setPreview(data.preview);
       setStatus(`Length: ${data.length}cm`);
       setPreviewProgress('');
     };
 
+    const handleQueueStats = (data: { queued: number, printing: number }) => {
+      setQueueDepth(data.queued + data.printing);
+    };
+
     // Add event listeners
     window.pyloid.EventAPI.listen('print_progress', handleProgress);
     window.pyloid.EventAPI.listen('print_finished', handleFinished);
     window.pyloid.EventAPI.listen('print_error', handleError);
     window.pyloid.EventAPI.listen('preview_ready', handlePreviewReady);
+    window.pyloid.EventAPI.listen('print_queue_stats', handleQueueStats);
 
     // Cleanup
     return () => {
@@ -60,20 +85,37 @@ function App() {
       window.pyloid.EventAPI.unlisten('print_finished', handleFinished);
       window.pyloid.EventAPI.unlisten('print_error', handleError);
       window.pyloid.EventAPI.unlisten('preview_ready', handlePreviewReady);
+      window.pyloid.EventAPI.unlisten('print_queue_stats', handleQueueStats);
     };
   }, []);
 
-  // Load printers on mount
+  // Load printers on mount, then follow background discovery
   useEffect(() => {
-    const loadPrinters = async () => {
-      const printerList = await window.pyloid.TextPrinterAPI.get_printers();
+    const updatePrinters = (printerList: Array<{ name: string, url: string }>) => {
       setPrinters(printerList);
-      if (printerList.length > 0) {
-        setSelectedPrinter(printerList[0].url);
+      setSelectedPrinter(current => {
+        if (printerList.some(printer => printer.url === current) || printerList.length === 0) {
+          return current;
+        }
         window.pyloid.TextPrinterAPI.set_printer(printerList[0].url);
-      }
+        return printerList[0].url;
+      });
+    };
+
+    const handlePrintersChanged = (data: { printers: Array<{ name: string, url: string }> }) => {
+      updatePrinters(data.printers);
+    };
+
+    window.pyloid.EventAPI.listen('printers_changed', handlePrintersChanged);
+
+    const loadPrinters = async () => {
+      updatePrinters(await window.pyloid.TextPrinterAPI.get_printers());
     };
     loadPrinters();
+
+    return () => {
+      window.pyloid.EventAPI.unlisten('printers_changed', handlePrintersChanged);
+    };
   }, []);
 
   // Update selected printer
@@ -85,6 +127,11 @@ function App() {
   const handlePreview = async () => {
     try {
       setStatus('Generating preview...');
+      if (isMarkdownMode || text.length <= TILED_PREVIEW_CHARS) {
+        // Drop a previous tiled preview, it would otherwise stay on screen in front of the new one
+        setTiledPreview(null);
+        setTileUrls({});
+      }
       if (isMarkdownMode) {
         // Create a hidden div for rendering
         const tempDiv = document.createElement('div');
@@ -120,8 +167,33 @@ function App() {
         const lengthCm = (canvas.height / dpi) * 2.54;
         setStatus(`Length: ${lengthCm.toFixed(1)}cm`);
         
-        // Store the canvas for printing
-        window.pyloid.TextPrinterAPI.store_canvas_data(canvas.toDataURL());
+        // Upload the canvas PNG over loopback and store it for printing by ID
+        try {
+          const uploadUrl = await window.pyloid.TextPrinterAPI.get_preview_upload_url();
+          const response = await fetch(uploadUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'image/png' },
+            body: blob
+          });
+          const { id } = await response.json();
+          await window.pyloid.TextPrinterAPI.store_canvas_preview(id);
+        } catch {
+          window.pyloid.TextPrinterAPI.store_canvas_data(canvas.toDataURL());
+        }
+      } else if (text.length > TILED_PREVIEW_CHARS) {
+        // Long text: get the layout right away and draw only the visible tiles
+        const result = await window.pyloid.TextPrinterAPI.open_tiled_preview(text, width, dpi, fontSize, margin);
+        if (result.error) {
+          setStatus('Error: ' + result.error);
+          return;
+        }
+        setPreview(null);
+        setTileUrls({});
+        setTiledPreview(result);
+        setStatus(`Length: ${result.length}cm`);
+        if (previewScrollRef.current) {
+          previewScrollRef.current.scrollTop = 0;
+        }
       } else {
         // Use existing preview method for plain text
         await window.pyloid.TextPrinterAPI.preview_text(text, width, dpi, fontSize, margin);
@@ -131,6 +203,45 @@ function App() {
     }
   };
 
+  // Fetch the tiles in and around the visible part of a tiled preview
+  const loadVisibleTiles = useCallback(async () => {
+    const scroller = previewScrollRef.current;
+    if (!tiledPreview || !scroller) {
+      return;
+    }
+    const scale = scroller.clientWidth / tiledPreview.width;
+    const tilePx = tiledPreview.tile_height * scale;
+    const first = Math.max(0, Math.floor(scroller.scrollTop / tilePx) - 1);
+    const last = Math.min(tiledPreview.tiles - 1, Math.ceil((scroller.scrollTop + scroller.clientHeight) / tilePx) + 1);
+    setVisibleTiles([first, last]);
+
+    if (requestedTiles.current.id !== tiledPreview.id) {
+      requestedTiles.current = { id: tiledPreview.id, indices: new Set() };
+    }
+    const requested = requestedTiles.current;
+    for (let index = first; index <= last; index++) {
+      // Scroll events fire while earlier tiles are still on their way, ask for each tile once
+      if (requested.indices.has(index)) {
+        continue;
+      }
+      requested.indices.add(index);
+      const url = await window.pyloid.TextPrinterAPI.get_preview_tile(tiledPreview.id, index);
+      if (requestedTiles.current !== requested) {
+        // A newer preview replaced this one
+        return;
+      }
+      if (url) {
+        setTileUrls(urls => ({ ...urls, [index]: url }));
+      } else {
+        requested.indices.delete(index);
+      }
+    }
+  }, [tiledPreview]);
+
+  useEffect(() => {
+    loadVisibleTiles();
+  }, [loadVisibleTiles]);
+
   const handlePrint = async () => {
     try {
       setStatus('Starting print job...');
@@ -256,17 +367,38 @@ function App() {
             </button>
             <button 
               onClick={handlePrint} 
-              disabled={(!text.trim() && !imagePath.trim()) || !preview || printProgress !== ''}
+              disabled={(!text.trim() && !imagePath.trim()) || (!preview && !tiledPreview) || printProgress !== ''}
             >
               {printProgress ? 'Printing...' : 'Print'}
             </button>
             {status && <div className="status">{status}</div>}
+            {queueDepth > 0 && <div className="status">Queued: {queueDepth}</div>}
           </div>
         </div>
 
         <div className="preview-panel">
-          <div className="preview-scroll">
-            {preview ? (
+          <div className="preview-scroll" ref={previewScrollRef} onScroll={loadVisibleTiles}>
+            {tiledPreview ? (
+              <div
+                className="preview-tiles"
+                style={{ aspectRatio: `${tiledPreview.width} / ${tiledPreview.height}` }}
+              >
+                {Object.entries(tileUrls)
+                  .filter(([index]) => Number(index) >= visibleTiles[0] && Number(index) <= visibleTiles[1])
+                  .map(([index, url]) => (
+                    <img
+                      key={index}
+                      className="preview-tile"
+                      src={url}
+                      alt=""
+                      style={{
+                        top: `${(Number(index) * tiledPreview.tile_height / tiledPreview.height) * 100}%`,
+                        height: `${(Math.min(tiledPreview.tile_height, tiledPreview.height - Number(index) * tiledPreview.tile_height) / tiledPreview.height) * 100}%`
+                      }}
+                    />
+                  ))}
+              </div>
+            ) : preview ? (
               <img src={preview} alt="Preview" />
             ) : (
               <div className="preview-placeholder">